@@ -37,7 +37,12 @@ function App() {
     }
   }
 
-  const fetchCart = async () => {
+  const fetchCart = async (updatedCart) => {
+    // Cart writes answer with the whole cart, so no extra GET is needed after them
+    if (Array.isArray(updatedCart)) {
+      setCart(updatedCart)
+      return
+    }
     try {
       const response = await axios.get(`${API_BASE}/customers/${customerId}/cart`)
       setCart(response.data)
@@ -19,38 +19,29 @@ function AdminDashboard({ apiBase, token }) {
     try {
       setLoading(true)
       
-      // Fetch products
-      const productsRes = await axios.get(`${apiBase}/products`)
+      // Fetch product count only (total comes back in X-Total-Count)
+      const productsRes = await axios.get(`${apiBase}/products`, {
+        params: { limit: 1, fields: 'id' }
+      })
       
-      // Fetch orders
-      const ordersRes = await axios.get(`${apiBase}/orders`, {
+      // Dashboard aggregates come from order-service summary tables (constant cost)
+      const statsRes = await axios.get(`${apiBase}/orders/stats`, {
+        params: { recent: 5 },
         headers: { Authorization: `Bearer ${token}` }
       })
-
-      const orders = ordersRes.data
-      const totalRevenue = orders.reduce((sum, order) => sum + (order.total_amount || 0), 0)
-      const pendingOrders = orders.filter(o => o.status === 'pending').length
+      const orderStats = statsRes.data
 
       setStats({
-        totalProducts: productsRes.data.length,
-        totalOrders: orders.length,
-        totalRevenue: totalRevenue,
-        pendingOrders: pendingOrders
+        totalProducts: Number(productsRes.headers['x-total-count'] || 0),
+        totalOrders: orderStats.total_orders,
+        totalRevenue: orderStats.total_revenue,
+        pendingOrders: orderStats.status_counts.pending || 0
       })
 
-      // Fetch customer info for recent orders
-      const recentOrdersList = orders.slice(0, 5)
-      const ordersWithCustomerInfo = await Promise.all(
-        recentOrdersList.map(async (order) => {
-          try {
-            const customerRes = await axios.get(`${apiBase}/customers/${order.customer_id}`)
-            return { ...order, customerInfo: customerRes.data }
-          } catch (error) {
-            console.error(`Failed to fetch customer ${order.customer_id}:`, error)
-            return { ...order, customerInfo: null }
-          }
-        })
-      )
+      const ordersWithCustomerInfo = orderStats.recent_orders.map(order => ({
+        ...order,
+        customerInfo: order.customer
+      }))
 
       setRecentOrders(ordersWithCustomerInfo)
     } catch (error) {
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import axios from 'axios'
 
 export default function Cart({ apiBase, token, customerId, cart, onCartUpdate }) {
@@ -7,6 +7,25 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
   const [message, setMessage] = useState('')
   const [note, setNote] = useState('')
   const [paymentMethod, setPaymentMethod] = useState('COD')
+  const [quantities, setQuantities] = useState({})
+  const pendingRef = useRef({})
+  const timerRef = useRef(null)
+
+  useEffect(() => () => clearTimeout(timerRef.current), [])
+
+  // Orders are accepted with 202 and finished in the background: poll until done
+  const waitForOrder = async (statusUrl) => {
+    for (let attempt = 0; attempt < 60; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, 1000))
+      const response = await axios.get(`${apiBase}${statusUrl}`, {
+        headers: { Authorization: `Bearer ${token}` }
+      })
+      if (response.data.status === 'completed' || response.data.status === 'failed') {
+        return response.data
+      }
+    }
+    return null
+  }
 
   useEffect(() => {
     if (cart.length > 0) {
@@ -15,38 +34,57 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
   }, [cart])
 
   const fetchProductDetails = async () => {
+    // One request: cart-service joins product names and prices server-side
     const productMap = {}
-    for (const item of cart) {
-      try {
-        const response = await axios.get(`${apiBase}/products/${item.product_id}`)
-        productMap[item.product_id] = response.data
-      } catch (error) {
-        console.error(`Failed to fetch product ${item.product_id}:`, error)
+    try {
+      const response = await axios.get(`${apiBase}/customers/${customerId}/cart`, {
+        params: { expand: 'product' }
+      })
+      for (const line of response.data.items) {
+        if (line.name !== null) {
+          productMap[line.product_id] = { name: line.name, price: line.unit_price }
+        }
       }
+    } catch (error) {
+      console.error('Failed to fetch product details:', error)
     }
     setProducts(productMap)
   }
 
-  const updateQuantity = async (productId, newQuantity) => {
-    if (newQuantity < 1) return
+  // Quantity clicks are collected for a moment and sent as one PATCH
+  const flushQuantities = async () => {
+    const pending = pendingRef.current
+    pendingRef.current = {}
+    const items = Object.entries(pending).map(([productId, quantity]) => ({
+      product_id: Number(productId),
+      quantity
+    }))
+    if (items.length === 0) return
     try {
-      await axios.put(`${apiBase}/customers/${customerId}/cart/${productId}`, {
-        product_id: productId,
-        quantity: newQuantity
-      })
-      onCartUpdate()
+      const response = await axios.patch(`${apiBase}/customers/${customerId}/cart`, { items })
+      onCartUpdate(response.data)
     } catch (error) {
-      console.error('Failed to update quantity:', error)
+      console.error('Failed to update cart:', error)
+      onCartUpdate()
+    } finally {
+      setQuantities({})
     }
   }
 
-  const removeItem = async (productId) => {
-    try {
-      await axios.delete(`${apiBase}/customers/${customerId}/cart/${productId}`)
-      onCartUpdate()
-    } catch (error) {
-      console.error('Failed to remove item:', error)
-    }
+  const queueQuantity = (productId, quantity) => {
+    pendingRef.current[productId] = quantity
+    setQuantities(prev => ({ ...prev, [productId]: quantity }))
+    clearTimeout(timerRef.current)
+    timerRef.current = setTimeout(flushQuantities, 300)
+  }
+
+  const updateQuantity = (productId, newQuantity) => {
+    if (newQuantity < 1) return
+    queueQuantity(productId, newQuantity)
+  }
+
+  const removeItem = (productId) => {
+    queueQuantity(productId, 0)
   }
 
   const placeOrder = async () => {
@@ -56,12 +94,16 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
     setMessage('')
     
     try {
-      const items = cart.map(item => ({
-        product_id: item.product_id,
-        quantity: item.quantity
-      }))
+      const items = cart
+        .map(item => ({
+          product_id: item.product_id,
+          quantity: quantities[item.product_id] ?? item.quantity
+        }))
+        .filter(item => item.quantity > 0)
+      clearTimeout(timerRef.current)
+      await flushQuantities()
 
-      await axios.post(
+      const response = await axios.post(
         `${apiBase}/ordering`,
         {
           customer_id: customerId,
@@ -70,12 +112,25 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
           payment_method: paymentMethod
         },
         {
-          headers: { Authorization: `Bearer ${token}` }
+          headers: { Authorization: `Bearer ${token}`, Prefer: 'respond-async' }
         }
       )
 
-      setMessage('✅ Order placed successfully!')
-      setNote('')
+      if (response.status === 202) {
+        setMessage('⏳ Order accepted, processing...')
+        const result = await waitForOrder(response.data.status_url)
+        if (!result) {
+          setMessage('⏳ Order is still processing, check your order history later')
+        } else if (result.status === 'failed') {
+          setMessage(`❌ ${result.error || 'Failed to place order'}`)
+        } else {
+          setMessage('✅ Order placed successfully!')
+          setNote('')
+        }
+      } else {
+        setMessage('✅ Order placed successfully!')
+        setNote('')
+      }
       onCartUpdate()
       setTimeout(() => setMessage(''), 5000)
     } catch (error) {
@@ -89,7 +144,8 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
   const calculateTotal = () => {
     return cart.reduce((total, item) => {
       const product = products[item.product_id]
-      return total + (product ? product.price * item.quantity : 0)
+      const quantity = quantities[item.product_id] ?? item.quantity
+      return total + (product ? product.price * quantity : 0)
     }, 0)
   }
 
@@ -118,9 +174,11 @@ export default function Cart({ apiBase, token, customerId, cart, onCartUpdate })
       )}
 
       <div className="bg-white rounded-lg shadow-md overflow-hidden mb-6">
-        {cart.map((item) => {
-          const product = products[item.product_id]
-          if (!product) return null
+        {cart.map((cartItem) => {
+          const product = products[cartItem.product_id]
+          const quantity = quantities[cartItem.product_id] ?? cartItem.quantity
+          if (!product || quantity === 0) return null
+          const item = { ...cartItem, quantity }
 
           return (
             <div key={item.id} className="flex items-center gap-4 p-4 border-b last:border-b-0">
@@ -11,27 +11,12 @@ export default function OrderHistory({ apiBase, token, isAdmin, customerId }) {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${apiBase}/orders`)
-      let ordersList = response.data
-      
-      // Customer chỉ xem orders của mình
-      if (!isAdmin && customerId) {
-        ordersList = ordersList.filter(order => order.customer_id === customerId)
-      }
-      
-      // Fetch customer info for each order
-      const ordersWithCustomerInfo = await Promise.all(
-        ordersList.map(async (order) => {
-          try {
-            const customerRes = await axios.get(`${apiBase}/customers/${order.customer_id}`)
-            return { ...order, customerInfo: customerRes.data }
-          } catch (error) {
-            console.error(`Failed to fetch customer ${order.customer_id}:`, error)
-            return { ...order, customerInfo: null }
-          }
-        })
-      )
-      
+      // Customer chỉ xem orders của mình (lọc ở server)
+      const params = !isAdmin && customerId ? { customer_id: customerId } : {}
+      // Customer summaries are embedded by order-service (one batched lookup per page)
+      const response = await axios.get(`${apiBase}/orders`, { params: { ...params, expand: 'customer' } })
+      const ordersWithCustomerInfo = response.data.map(order => ({ ...order, customerInfo: order.customer }))
+
       setOrders(ordersWithCustomerInfo)
     } catch (error) {
       console.error('Failed to fetch orders:', error)
@@ -1,8 +1,11 @@
 import { useState, useEffect } from 'react'
 import axios from 'axios'
 
+const PAGE_SIZE = 24
+
 export default function ProductList({ apiBase, token, customerId, onCartUpdate, isAdmin, userRole }) {
   const [products, setProducts] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const [message, setMessage] = useState('')
   const [showForm, setShowForm] = useState(false)
@@ -18,10 +21,13 @@ export default function ProductList({ apiBase, token, customerId, onCartUpdate,
     fetchProducts()
   }, [])
 
-  const fetchProducts = async () => {
+  const fetchProducts = async (cursor = null) => {
     try {
-      const response = await axios.get(`${apiBase}/products`)
-      setProducts(response.data)
+      const params = { limit: PAGE_SIZE }
+      if (cursor) params.cursor = cursor
+      const response = await axios.get(`${apiBase}/products`, { params })
+      setProducts(cursor ? [...products, ...response.data] : response.data)
+      setNextCursor(response.headers['x-next-cursor'] || null)
     } catch (error) {
       console.error('Failed to fetch products:', error)
     } finally {
@@ -31,13 +37,14 @@ export default function ProductList({ apiBase, token, customerId, onCartUpdate,
 
   const addToCart = async (productId) => {
     try {
-      await axios.post(`${apiBase}/customers/${customerId}/cart`, {
-        product_id: productId,
-        quantity: 1
-      })
+      const response = await axios.put(
+        `${apiBase}/customers/${customerId}/cart`,
+        { items: [{ product_id: productId, quantity: 1 }] },
+        { params: { mode: 'merge' } }
+      )
       setMessage('✅ Added to cart!')
       setTimeout(() => setMessage(''), 3000)
-      onCartUpdate()
+      onCartUpdate(response.data)
     } catch (error) {
       setMessage('❌ Failed to add to cart')
       setTimeout(() => setMessage(''), 3000)
@@ -263,6 +270,17 @@ export default function ProductList({ apiBase, token, customerId, onCartUpdate,
           </div>
         ))}
       </div>
+
+      {nextCursor && (
+        <div className="text-center mt-6">
+          <button
+            onClick={() => fetchProducts(nextCursor)}
+            className="bg-gray-200 hover:bg-gray-300 text-gray-800 font-semibold py-2 px-6 rounded-lg transition"
+          >
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   )
 }
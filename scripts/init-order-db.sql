@@ -12,6 +12,11 @@ CREATE TABLE IF NOT EXISTS orders (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Idempotency key of POST /orders, kept out of CREATE TABLE so an order_db created
+-- before it can be upgraded by running these two statements
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS request_id VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_request_id ON orders(request_id);
+
 -- Order items table
 CREATE TABLE IF NOT EXISTS order_items (
     id SERIAL PRIMARY KEY,
@@ -23,6 +28,26 @@ CREATE TABLE IF NOT EXISTS order_items (
     FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
 );
 
+-- Dashboard summary tables (GET /orders/stats), maintained by order-service in the
+-- same transaction as order writes; rebuild with `python order_stats.py rebuild`
+CREATE TABLE IF NOT EXISTS order_status_counts (
+    status VARCHAR(50) PRIMARY KEY,
+    order_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS order_daily_revenue (
+    day DATE PRIMARY KEY,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS product_sales (
+    product_id INTEGER PRIMARY KEY,
+    product_name VARCHAR(255),
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+
 -- Note: No foreign key to product_db.products!
 -- We store product_name to avoid cross-database queries
 -- This is data duplication but necessary for microservices
@@ -43,7 +68,24 @@ INSERT INTO order_items (order_id, product_id, product_name, quantity, price) VA
     (3, 4, 'Samsung Galaxy S24', 1, 799.00)
 ON CONFLICT DO NOTHING;
 
+-- Summaries for the demo orders (cancelled orders don't count toward revenue / sales)
+INSERT INTO order_status_counts (status, order_count)
+    SELECT status, COUNT(*) FROM orders GROUP BY status
+ON CONFLICT DO NOTHING;
+
+INSERT INTO order_daily_revenue (day, order_count, revenue)
+    SELECT DATE(created_at), COUNT(*), COALESCE(SUM(total_amount), 0)
+    FROM orders WHERE status <> 'cancelled' GROUP BY DATE(created_at)
+ON CONFLICT DO NOTHING;
+
+INSERT INTO product_sales (product_id, product_name, quantity, revenue)
+    SELECT oi.product_id, MAX(oi.product_name), SUM(oi.quantity), SUM(oi.price * oi.quantity)
+    FROM order_items oi JOIN orders o ON o.id = oi.order_id
+    WHERE o.status <> 'cancelled' GROUP BY oi.product_id
+ON CONFLICT DO NOTHING;
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders(customer_id);
 CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
 CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
+CREATE INDEX IF NOT EXISTS idx_product_sales_quantity ON product_sales(quantity);
@@ -0,0 +1,30 @@
+-- Ordering (make-order-service) Database Initialization
+
+-- Orders accepted with Prefer: respond-async and the progress of their saga
+CREATE TABLE IF NOT EXISTS order_requests (
+    id VARCHAR(36) PRIMARY KEY,
+    customer_id VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,  -- Items, note, payment method + customer / product snapshot
+    status VARCHAR(20) NOT NULL DEFAULT 'accepted',
+    step VARCHAR(30) NOT NULL DEFAULT 'accepted',
+    order_id INTEGER,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Transactional outbox: written with the request, drained by the dispatcher
+CREATE TABLE IF NOT EXISTS ordering_outbox (
+    id SERIAL PRIMARY KEY,
+    request_id VARCHAR(36) NOT NULL REFERENCES order_requests(id) ON DELETE CASCADE,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    processed_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_requests_customer_id ON order_requests(customer_id);
+-- Pending entries only: the dispatcher's claim query stays small as history grows
+CREATE INDEX IF NOT EXISTS idx_ordering_outbox_pending ON ordering_outbox(available_at) WHERE processed_at IS NULL;
@@ -11,6 +11,21 @@ CREATE TABLE IF NOT EXISTS products (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Stock reservations, keyed by the caller's request id so reserve/release can be retried safely
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    reservation_id VARCHAR(64) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS stock_reservation_items (
+    reservation_id VARCHAR(64) NOT NULL REFERENCES stock_reservations(reservation_id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (reservation_id, product_id)
+);
+
 -- Insert demo products
 INSERT INTO products (name, price, inventory, description) VALUES
     ('Laptop Dell XPS 13', 1500.00, 10, 'Laptop cao cấp, màn hình 13 inch, CPU Intel i7'),
@@ -22,3 +37,4 @@ ON CONFLICT DO NOTHING;
 
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products(price);
@@ -5,13 +5,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from jose import jwt, JWTError
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import get_db, User as DBUser
+from common.serialization import CompressionMiddleware, FastJSONResponse
+from common.db import DBRunner
+from database import get_db_runner, pool_stats, User as DBUser
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "devsecret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
-app = FastAPI(title="Auth Service")
+app = FastAPI(title="Auth Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -45,9 +49,13 @@ def _create_token(customer_id: str, role: str) -> str:
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def _find_user(db: Session, username: str):
+    return db.query(DBUser).filter(DBUser.username == username).first()
+
+
 @app.post("/auth/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(DBUser).filter(DBUser.username == payload.username).first()
+async def login(payload: LoginRequest, db: DBRunner = Depends(get_db_runner)):
+    user = await db.run(_find_user, payload.username)
     if not user or user.password != payload.password:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = _create_token(user.customer_id, user.role)
@@ -68,6 +76,11 @@ def validate_token(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
 
+@app.get("/metrics")
+def metrics():
+    return {"db_pool": pool_stats()}
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -0,0 +1,160 @@
+"""
+Per-response CPU cost of serializing the product and order lists.
+
+Run from the services/ directory:
+
+    python -m benchmarks.bench_serialization [--products 500] [--orders 200] [--repeat 200]
+
+Compares, for the same ORM rows and response models:
+- fastapi-dump-json: response_model validation + pydantic-core JSON (FastAPI's path
+  when no custom response class is set)
+- fastapi-json: response_model validation + jsonable dict + json.dumps (older FastAPI,
+  or any custom response class)
+- orjson-default: response_model validation + FastJSONResponse
+- trusted: common.serialization.trusted_response (no re-validation) + orjson
+and the size/CPU of gzip and brotli on the encoded body.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from pydantic import TypeAdapter
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICES_DIR)
+
+from common.serialization import FastJSONResponse, _compress, brotli, trusted_response  # noqa: E402
+
+
+def _load_service(name: str):
+    """Import a service's database and main modules (DATABASE_URL points at sqlite, nothing connects)"""
+    os.environ["DATABASE_URL"] = "sqlite://"
+    path = os.path.join(SERVICES_DIR, name)
+    for module in ("main", "database", "catalog_cache"):
+        sys.modules.pop(module, None)
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module("database"), importlib.import_module("main")
+    finally:
+        sys.path.remove(path)
+
+
+def _product_rows(database, count: int):
+    now = datetime(2024, 1, 1)
+    return [
+        database.Product(
+            id=i,
+            name=f"Product {i}",
+            price=Decimal("19.99") + i,
+            inventory=i % 50,
+            description="Mô tả sản phẩm " * 4,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def _order_rows(database, count: int, items_per_order: int = 3):
+    now = datetime(2024, 1, 1)
+    orders = []
+    for i in range(1, count + 1):
+        items = [
+            database.OrderItem(
+                id=i * 10 + j,
+                order_id=i,
+                product_id=j + 1,
+                product_name=f"Product {j + 1}",
+                quantity=j + 1,
+                price=Decimal("9.50") * (j + 1),
+            )
+            for j in range(items_per_order)
+        ]
+        orders.append(database.Order(
+            id=i,
+            customer_id="12345",
+            note="Giao giờ hành chính",
+            payment_method="COD",
+            status="pending",
+            total_amount=Decimal("57.00"),
+            created_at=now - timedelta(minutes=i),
+            updated_at=now,
+            items=items,
+        ))
+    return orders
+
+
+def _cpu_per_call(fn, repeat: int) -> float:
+    fn()  # warm-up (builds pydantic validators, field plans)
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat
+
+
+def _bench(label: str, rows, model, repeat: int):
+    adapter = TypeAdapter(List[model])
+
+    def fastapi_dump_json():
+        return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    def fastapi_json():
+        content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def orjson_default():
+        content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+        return FastJSONResponse(content).body
+
+    def trusted():
+        return trusted_response(rows, model).body
+
+    assert json.loads(trusted()) == json.loads(fastapi_dump_json()), "fast path output differs"
+
+    print(f"\n{label}: {len(rows)} rows")
+    baseline = None
+    for name, fn in (
+        ("fastapi-dump-json", fastapi_dump_json),
+        ("fastapi-json", fastapi_json),
+        ("orjson-default", orjson_default),
+        ("trusted", trusted),
+    ):
+        cost = _cpu_per_call(fn, repeat)
+        baseline = baseline or cost
+        print(f"  {name:<18} {cost * 1e3:8.3f} ms/response  ({baseline / cost:4.1f}x vs fastapi-dump-json)")
+
+    body = trusted()
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    for encoding in encodings:
+        compressed = _compress(body, encoding, gzip_level=6, brotli_quality=4)
+        cost = _cpu_per_call(lambda: _compress(body, encoding, 6, 4), max(repeat // 4, 1))
+        print(
+            f"  {encoding:<18} {cost * 1e3:8.3f} ms/response  "
+            f"{len(body) / 1024:7.1f} KiB -> {len(compressed) / 1024:6.1f} KiB"
+        )
+    if brotli is None:
+        print("  br                 (brotli not installed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    product_db, product_main = _load_service("product-service")
+    _bench("GET /products", _product_rows(product_db, args.products), product_main.Product, args.repeat)
+
+    order_db, order_main = _load_service("order-service")
+    _bench("GET /orders", _order_rows(order_db, args.orders), order_main.Order, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,12 +24,15 @@ function App() {
       
       // Fetch product details
       const productMap = {}
-      for (const item of response.data) {
+      if (response.data.length > 0) {
         try {
-          const prod = await axios.get(`${PRODUCT_API}/products/${item.product_id}`)
-          productMap[item.product_id] = prod.data
+          const ids = response.data.map(item => item.product_id).join(',')
+          const prods = await axios.get(`${PRODUCT_API}/products`, { params: { ids } })
+          for (const prod of prods.data) {
+            productMap[prod.id] = prod
+          }
         } catch (err) {
-          console.error(`Failed to fetch product ${item.product_id}`)
+          console.error('Failed to fetch product details')
         }
       }
       setProducts(productMap)
@@ -1,11 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Literal
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from sqlalchemy import case, delete, select, update
 from sqlalchemy.orm import Session
-from database import get_db, CartItem as DBCartItem
+from common.etag import body_etag, conditional_json, etag_matches, make_etag, not_modified
+from common.http_client import (
+    aclose_clients,
+    async_request_with_cb,
+    get_breaker_stats,
+    get_bulkhead_stats,
+    get_cache_stats,
+    get_coalescing_stats,
+    get_pool_stats,
+    get_retry_stats,
+)
+from common.serialization import CompressionMiddleware, FastJSONResponse, dumps
+from common.db import DBRunner, dialect_insert
+from database import get_db, get_db_runner, pool_stats, CartItem as DBCartItem
+
+PRODUCT_URL = os.getenv("PRODUCT_URL", "http://product-service:8002")
 
-app = FastAPI(title="Cart Service")
+app = FastAPI(title="Cart Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,6 +35,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
@@ -24,6 +47,10 @@ class CartItem(BaseModel):
         from_attributes = True
 
 
+class CartItems(BaseModel):
+    items: List[CartItem]
+
+
 class CartItemResponse(BaseModel):
     id: int
     customer_id: str
@@ -34,64 +61,223 @@ class CartItemResponse(BaseModel):
         from_attributes = True
 
 
-@app.get("/customers/{customer_id}/cart", response_model=List[CartItemResponse])
-def get_cart(customer_id: str, db: Session = Depends(get_db)):
-    items = db.query(DBCartItem).filter(DBCartItem.customer_id == customer_id).all()
+class CartLine(BaseModel):
+    id: int
+    product_id: int
+    quantity: int
+    name: str | None = None           # None if the product no longer exists
+    unit_price: float | None = None
+    line_total: float
+    in_stock: bool
+
+
+class CartView(BaseModel):
+    customer_id: str
+    items: List[CartLine]
+    item_count: int
+    total: float
+
+
+def _cart_items(db: Session, customer_id: str):
+    return db.query(DBCartItem).filter(DBCartItem.customer_id == customer_id).order_by(DBCartItem.id).all()
+
+
+async def _get_products(product_ids: List[int]) -> dict:
+    """All products of the cart with one batched call (pooled, circuit breaker, cached), keyed by id"""
+    if not product_ids:
+        return {}
+    resp = await async_request_with_cb(
+        "product",
+        PRODUCT_URL,
+        "get",
+        "/products",
+        params={"ids": ",".join(str(pid) for pid in sorted(set(product_ids)))},
+        idempotent=True,
+    )
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"Product lookup failed with status {resp.status_code}")
+    return {product["id"]: product for product in resp.json()}
+
+
+def _cart_view(customer_id: str, items, products: dict) -> dict:
+    lines = []
+    total = Decimal("0")
+    for item in items:
+        product = products.get(item.product_id)
+        price = Decimal(str(product["price"])) if product else None
+        line_total = price * item.quantity if price is not None else Decimal("0")
+        total += line_total
+        lines.append({
+            "id": item.id,
+            "product_id": item.product_id,
+            "quantity": item.quantity,
+            "name": product["name"] if product else None,
+            "unit_price": float(price) if price is not None else None,
+            "line_total": float(line_total),
+            "in_stock": bool(product) and product.get("inventory", 0) >= item.quantity,
+        })
+    return {
+        "customer_id": customer_id,
+        "items": lines,
+        "item_count": sum(item.quantity for item in items),
+        "total": float(total),
+    }
+
+
+@app.get(
+    "/customers/{customer_id}/cart",
+    response_model=List[CartItemResponse],
+    responses={200: {"description": "With expand=product the body is a CartView", "model": CartView}},
+)
+async def get_cart(
+    customer_id: str,
+    response: Response,
+    expand: Literal["product"] | None = Query(default=None, description="product: lines with name, unit price and totals"),
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    items = await db.run(_cart_items, customer_id)
+    if expand == "product":
+        # Prices come from product-service, so the ETag is taken from the rendered body
+        body = dumps(_cart_view(customer_id, items, await _get_products([item.product_id for item in items])))
+        return conditional_json(body, body_etag(body), if_none_match)
+
+    etag = make_etag(customer_id, *[(item.id, item.quantity, item.updated_at) for item in items])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return items
 
 
+# Columns returned by the write statements (RETURNING), matching CartItemResponse
+_ITEM_COLUMNS = (DBCartItem.id, DBCartItem.customer_id, DBCartItem.product_id, DBCartItem.quantity)
+
+
+def _upsert(db: Session, customer_id: str, quantities: dict[int, int], merge: bool) -> List[dict]:
+    """
+    Insert or update several lines with one INSERT ... ON CONFLICT (customer_id, product_id) DO UPDATE.
+    merge=True adds to the existing quantity, otherwise the quantity is replaced.
+    """
+    now = datetime.utcnow()
+    stmt = dialect_insert(db)(DBCartItem).values([
+        {"customer_id": customer_id, "product_id": product_id, "quantity": quantity, "created_at": now, "updated_at": now}
+        for product_id, quantity in quantities.items()
+    ])
+    quantity = DBCartItem.quantity + stmt.excluded.quantity if merge else stmt.excluded.quantity
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DBCartItem.customer_id, DBCartItem.product_id],
+        set_={"quantity": quantity, "updated_at": now},
+    ).returning(*_ITEM_COLUMNS)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+
+def _select_cart(db: Session, customer_id: str) -> List[dict]:
+    rows = db.execute(select(*_ITEM_COLUMNS).where(DBCartItem.customer_id == customer_id).order_by(DBCartItem.id))
+    return [dict(row._mapping) for row in rows]
+
+
+def _bulk_quantities(items: List[CartItem], merge: bool) -> dict[int, int]:
+    if any(item.quantity < 1 for item in items):
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+    # Duplicate lines are summed when merging; otherwise the last one wins
+    quantities: dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity if merge else item.quantity
+    return quantities
+
+
 @app.post("/customers/{customer_id}/cart", response_model=CartItemResponse, status_code=201)
 def add_to_cart(customer_id: str, item: CartItem, db: Session = Depends(get_db)):
-    # Check if item already exists
-    existing = db.query(DBCartItem).filter(
-        DBCartItem.customer_id == customer_id,
-        DBCartItem.product_id == item.product_id
-    ).first()
-    
-    if existing:
-        existing.quantity += item.quantity
-        db.commit()
-        db.refresh(existing)
-        return existing
-    
-    new_item = DBCartItem(
-        customer_id=customer_id,
-        product_id=item.product_id,
-        quantity=item.quantity
-    )
-    db.add(new_item)
+    # Single upsert: concurrent adds of the same product can't race into a unique violation
+    row = _upsert(db, customer_id, {item.product_id: item.quantity}, merge=True)[0]
     db.commit()
-    db.refresh(new_item)
-    return new_item
+    return row
+
+
+@app.put("/customers/{customer_id}/cart", response_model=List[CartItemResponse])
+def replace_cart(
+    customer_id: str,
+    payload: CartItems,
+    mode: Literal["replace", "merge"] = Query(default="replace", description="replace: cart becomes exactly these items; merge: add these quantities"),
+    db: Session = Depends(get_db),
+):
+    quantities = _bulk_quantities(payload.items, merge=mode == "merge")
+    if mode == "replace":
+        db.execute(
+            delete(DBCartItem)
+            .where(DBCartItem.customer_id == customer_id, DBCartItem.product_id.not_in(list(quantities)))
+            .execution_options(synchronize_session=False)
+        )
+        items = _upsert(db, customer_id, quantities, merge=False) if quantities else []
+        items.sort(key=lambda item: item["id"])
+    else:
+        if quantities:
+            _upsert(db, customer_id, quantities, merge=True)
+        items = _select_cart(db, customer_id)
+    db.commit()
+    return items
+
+
+@app.patch("/customers/{customer_id}/cart", response_model=List[CartItemResponse])
+def update_cart_quantities(customer_id: str, payload: CartItems, db: Session = Depends(get_db)):
+    """Set several quantities at once (0 removes the line); returns the whole cart"""
+    quantities = {item.product_id: item.quantity for item in payload.items}
+    if any(quantity < 0 for quantity in quantities.values()):
+        raise HTTPException(status_code=400, detail="Quantity must not be negative")
+    updates = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    removals = [product_id for product_id, quantity in quantities.items() if quantity == 0]
+
+    found = set()
+    if updates:
+        found.update(db.execute(
+            update(DBCartItem)
+            .where(DBCartItem.customer_id == customer_id, DBCartItem.product_id.in_(list(updates)))
+            .values(quantity=case(updates, value=DBCartItem.product_id), updated_at=datetime.utcnow())
+            .returning(DBCartItem.product_id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    if removals:
+        found.update(db.execute(
+            delete(DBCartItem)
+            .where(DBCartItem.customer_id == customer_id, DBCartItem.product_id.in_(removals))
+            .returning(DBCartItem.product_id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+
+    missing = sorted(set(quantities) - found)
+    if missing:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"Items not found in cart: {missing}")
+    items = _select_cart(db, customer_id)
+    db.commit()
+    return items
 
 
 @app.put("/customers/{customer_id}/cart/{product_id}", response_model=CartItemResponse)
 def update_cart_item(customer_id: str, product_id: int, item: CartItem, db: Session = Depends(get_db)):
-    cart_item = db.query(DBCartItem).filter(
-        DBCartItem.customer_id == customer_id,
-        DBCartItem.product_id == product_id
+    row = db.execute(
+        update(DBCartItem)
+        .where(DBCartItem.customer_id == customer_id, DBCartItem.product_id == product_id)
+        .values(quantity=item.quantity, updated_at=datetime.utcnow())
+        .returning(*_ITEM_COLUMNS)
+        .execution_options(synchronize_session=False)
     ).first()
-    
-    if not cart_item:
+    if row is None:
         raise HTTPException(status_code=404, detail="Item not found in cart")
-    
-    cart_item.quantity = item.quantity
     db.commit()
-    db.refresh(cart_item)
-    return cart_item
+    return dict(row._mapping)
 
 
 @app.delete("/customers/{customer_id}/cart/{product_id}")
 def remove_from_cart(customer_id: str, product_id: int, db: Session = Depends(get_db)):
-    cart_item = db.query(DBCartItem).filter(
-        DBCartItem.customer_id == customer_id,
-        DBCartItem.product_id == product_id
+    removed = db.execute(
+        delete(DBCartItem)
+        .where(DBCartItem.customer_id == customer_id, DBCartItem.product_id == product_id)
+        .returning(DBCartItem.id)
+        .execution_options(synchronize_session=False)
     ).first()
-    
-    if not cart_item:
+    if removed is None:
         raise HTTPException(status_code=404, detail="Item not found in cart")
-    
-    db.delete(cart_item)
     db.commit()
     return {"status": "removed"}
 
@@ -103,6 +289,25 @@ def clear_cart(customer_id: str, db: Session = Depends(get_db)):
     return {"status": "cleared"}
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled product-service connections"""
+    await aclose_clients()
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "db_pool": pool_stats(),
+        "circuit_breakers": get_breaker_stats(),
+        "http_pools": get_pool_stats(),
+        "response_cache": get_cache_stats(),
+        "coalescing": get_coalescing_stats(),
+        "bulkheads": get_bulkhead_stats(),
+        "retries": get_retry_stats(),
+    }
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
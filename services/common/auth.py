@@ -0,0 +1,84 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException
+from jose import jwt, JWTError
+
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "devsecret")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))          # Max decoded tokens kept in memory
+AUTH_CACHE_MAX_TTL = int(os.getenv("AUTH_CACHE_MAX_TTL", "300"))      # TTL for tokens without an exp claim
+
+_claims_cache: "OrderedDict[bytes, tuple]" = OrderedDict()  # {sha256(token): (claims, expires_at)}
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _cache_get(key: bytes) -> Optional[dict]:
+    with _cache_lock:
+        entry = _claims_cache.get(key)
+        if entry is None:
+            _cache_stats["misses"] += 1
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            # Token expired since it was cached
+            del _claims_cache[key]
+            _cache_stats["evictions"] += 1
+            _cache_stats["misses"] += 1
+            return None
+        _claims_cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return claims
+
+
+def _cache_put(key: bytes, claims: dict):
+    exp = claims.get("exp")
+    expires_at = float(exp) if exp is not None else time.time() + AUTH_CACHE_MAX_TTL
+    with _cache_lock:
+        _claims_cache[key] = (claims, expires_at)
+        _claims_cache.move_to_end(key)
+        while len(_claims_cache) > AUTH_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verify a JWT locally and return its claims.
+    Decoded claims are cached by token digest until the token's exp passes.
+    Raises JWTError for invalid or expired tokens.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = _cache_get(key)
+    if claims is None:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        _cache_put(key, claims)
+    return claims
+
+
+def verify_bearer(auth_header: str | None) -> dict:
+    """Validate an `Authorization: Bearer <token>` header and return the token claims"""
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing/invalid Authorization")
+    token = auth_header.split(" ", 1)[1]
+    try:
+        return decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def require_admin(auth_header: str | None) -> dict:
+    claims = verify_bearer(auth_header)
+    if claims.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return claims
+
+
+def get_cache_stats() -> dict:
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_claims_cache), capacity=AUTH_CACHE_SIZE)
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+
+class BulkheadFull(Exception):
+    """Raised when a call is shed: the wait queue is full or the wait timed out"""
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by latency.
+
+    When recent latency (a fast moving average) exceeds `tolerance` x the long-run
+    baseline, or a call fails, the limit is multiplied by `backoff`; otherwise each call
+    completed while the limit is in use adds 1/limit (about +1 per limit's worth of
+    calls). The baseline is a slow moving average, so a dependency that stays slow for
+    long becomes the new normal and the limit recovers.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float = 2.0, backoff: float = 0.9):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.recent: Optional[float] = None    # Seconds, EWMA over roughly the last 5 calls
+        self.baseline: Optional[float] = None  # Seconds, EWMA over roughly the last 100 calls
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def on_sample(self, latency: float, failed: bool, in_flight: int):
+        if self.baseline is None:
+            self.recent = self.baseline = latency
+        self.recent += 0.2 * (latency - self.recent)
+        if failed or self.recent > self.tolerance * self.baseline:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+        elif in_flight + 1 >= self.limit:
+            # Only grow when the current limit is actually the constraint
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        if not failed:
+            self.baseline += 0.01 * (latency - self.baseline)
+
+
+class _Waiter:
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Bulkhead:
+    """
+    Per-service limit on in-flight calls, shared by threads and asyncio tasks.
+
+    Calls over the limit wait in a FIFO queue of at most `max_queue` callers for at most
+    `queue_timeout` seconds; beyond that they are shed with BulkheadFull, so a slow
+    dependency holds at most limit + max_queue callers instead of every worker.
+    With `adaptive`, the limit follows observed latency (see AdaptiveLimit).
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float, adaptive: Optional[AdaptiveLimit] = None):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._stats = {"accepted": 0, "queued": 0, "rejected": 0, "timeouts": 0}
+
+    @property
+    def limit(self) -> int:
+        return self.adaptive.limit if self.adaptive else self.max_concurrent
+
+    def acquire(self):
+        waiter = self._enqueue(None)
+        if waiter is not None and not waiter.event.wait(self.queue_timeout) and not self._abandon(waiter):
+            raise BulkheadFull(f"{self.name}: no free slot within {self.queue_timeout}s")
+
+    async def aacquire(self):
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise BulkheadFull(f"{self.name}: no free slot within {self.queue_timeout}s")
+        except asyncio.CancelledError:
+            if self._abandon(waiter, timed_out=False):
+                self.release()
+            raise
+
+    def release(self, latency: Optional[float] = None, failed: bool = False):
+        """Give the slot back; `latency` (seconds) of a completed call feeds the adaptive limit"""
+        with self._lock:
+            self._in_flight -= 1
+            if self.adaptive is not None and latency is not None:
+                self.adaptive.on_sample(latency, failed, self._in_flight)
+            self._grant_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                **self._stats,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "limit": self.limit,
+                "max_queue": self.max_queue,
+            }
+            if self.adaptive is not None:
+                stats["adaptive"] = True
+                if self.adaptive.baseline is not None:
+                    stats["recent_ms"] = round(self.adaptive.recent * 1000, 1)
+                    stats["baseline_ms"] = round(self.adaptive.baseline * 1000, 1)
+        return stats
+
+    def _enqueue(self, loop) -> Optional[_Waiter]:
+        """Take a slot (returns None) or join the wait queue; raises BulkheadFull when it is full"""
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                self._stats["accepted"] += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise BulkheadFull(f"{self.name}: {self._in_flight} calls in flight, {len(self._waiters)} waiting")
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self._stats["queued"] += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Leave the wait queue; True if the slot was handed over meanwhile (the caller owns it)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            if timed_out:
+                self._stats["timeouts"] += 1
+            return False
+
+    def _grant_locked(self):
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            self._stats["accepted"] += 1
+            waiter.wake()
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class _TimeWindow:
+    """
+    Success/failure counts over the last `seconds`, kept in one-second buckets.
+    Totals are maintained incrementally, so recording and reading are O(1) amortized.
+    """
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self._stamps = [-1] * seconds
+        self._successes = [0] * seconds
+        self._failures = [0] * seconds
+        self.total_successes = 0
+        self.total_failures = 0
+        self._last_second = -1
+
+    def _advance(self, now: float):
+        second = int(now)
+        if second <= self._last_second:
+            return
+        # Expire buckets that fell out of the window (at most `seconds` of them)
+        start = max(self._last_second + 1, second - self.seconds + 1)
+        for s in range(start, second + 1):
+            idx = s % self.seconds
+            self.total_successes -= self._successes[idx]
+            self.total_failures -= self._failures[idx]
+            self._stamps[idx] = s
+            self._successes[idx] = 0
+            self._failures[idx] = 0
+        self._last_second = second
+
+    def record(self, success: bool, now: float):
+        self._advance(now)
+        idx = int(now) % self.seconds
+        if success:
+            self._successes[idx] += 1
+            self.total_successes += 1
+        else:
+            self._failures[idx] += 1
+            self.total_failures += 1
+
+    def counts(self, now: float):
+        self._advance(now)
+        return self.total_successes + self.total_failures, self.total_failures
+
+    def reset(self):
+        self.__init__(self.seconds)
+
+
+class ServiceBreaker:
+    """
+    Error-rate circuit breaker for one downstream service.
+
+    State is guarded by a per-service lock, so services never contend with each
+    other. Failures are tracked in a count window (last `window_size` requests)
+    and, optionally, a time window (last `time_window` seconds); both keep
+    running totals so every update is O(1). The circuit opens when either window
+    has at least `min_requests` calls and an error rate >= `error_rate`.
+    After `reset_timeout` seconds a single trial request is let through (HALF_OPEN).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int,
+        min_requests: int,
+        error_rate: float,
+        reset_timeout: float,
+        time_window: int = 0,
+        log_interval: float = 10.0,
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate
+        self.reset_timeout = reset_timeout
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=window_size)
+        self._failures = 0
+        self._time_window = _TimeWindow(time_window) if time_window > 0 else None
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started = 0.0       # Start of the in-flight HALF_OPEN trial, 0 if none
+        self._last_log = 0.0
+        self._suppressed_logs = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """False if the circuit is OPEN (or a HALF_OPEN trial is already in flight)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                # One trial at a time; a lost trial (no result recorded) expires after reset_timeout
+                if not self._probe_started or now - self._probe_started >= self.reset_timeout:
+                    self._probe_started = now
+                    return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        self._record(True)
+
+    def record_failure(self):
+        self._record(False)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._count_rate()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                "state": self._state,
+                "error_rate": round(self._count_rate(), 3),
+                "window_requests": len(self._history),
+                "window_failures": self._failures,
+                "rejected": self._rejected,
+            }
+            if self._time_window is not None:
+                total, failures = self._time_window.counts(time.time())
+                snapshot.update({
+                    "time_window_seconds": self._time_window.seconds,
+                    "time_window_requests": total,
+                    "time_window_failures": failures,
+                })
+            return snapshot
+
+    def log(self, message: str, force: bool = False):
+        """Structured, rate-limited log line (at most one per log_interval unless forced)"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_log < self.log_interval:
+                self._suppressed_logs += 1
+                return
+            suppressed, self._suppressed_logs = self._suppressed_logs, 0
+            self._last_log = now
+        logger.warning(
+            f"[Circuit Breaker] {message}",
+            extra={"service": self.name, "circuit_state": self._state, "suppressed": suppressed},
+        )
+
+    def _record(self, success: bool):
+        with self._lock:
+            if self._history and len(self._history) == self._history.maxlen and not self._history[0]:
+                self._failures -= 1
+            self._history.append(success)
+            if not success:
+                self._failures += 1
+            if self._time_window is not None:
+                self._time_window.record(success, time.time())
+
+            if self._state == HALF_OPEN:
+                self._probe_started = 0.0
+                self._transition(CLOSED if success else OPEN)
+            elif self._state == CLOSED and not success and self._should_trip():
+                self._transition(OPEN)
+
+    def _count_rate(self) -> float:
+        return self._failures / len(self._history) if self._history else 0.0
+
+    def _should_trip(self) -> bool:
+        if len(self._history) >= self.min_requests and self._count_rate() >= self.error_rate_threshold:
+            return True
+        if self._time_window is not None:
+            total, failures = self._time_window.counts(time.time())
+            if total >= self.min_requests and failures / total >= self.error_rate_threshold:
+                return True
+        return False
+
+    def _transition(self, new_state: str):
+        rate = self._count_rate()
+        old_state, self._state = self._state, new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        elif new_state == CLOSED:
+            # Start from a clean window once the service has recovered
+            self._history.clear()
+            self._failures = 0
+            if self._time_window is not None:
+                self._time_window.reset()
+        # State changes are always logged (called with the lock held, so log directly)
+        logger.warning(
+            f"[Circuit Breaker] {self.name}: {old_state} -> {new_state} "
+            f"(error rate {rate:.1%}, threshold {self.error_rate_threshold:.1%})",
+            extra={"service": self.name, "circuit_state": new_state},
+        )
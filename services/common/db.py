@@ -0,0 +1,125 @@
+import os
+from typing import Any, Callable, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from starlette.concurrency import run_in_threadpool
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+DB_ASYNC = _env_flag("DB_ASYNC", "false")                          # Opt-in: asyncpg / aiosqlite engine for read routes
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))                # Connections kept open per process
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))          # Extra connections under burst load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))        # Seconds to wait for a free connection
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", "true")           # Test connections on checkout (survives DB restarts)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # Reconnect connections older than this (seconds)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _pool_options(url: str) -> dict:
+    # SQLite (local runs) keeps SQLAlchemy's default single-file pool
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def create_db_engine(url: str):
+    return create_engine(url, **_pool_options(url))
+
+
+def dialect_insert(session):
+    """
+    insert() construct of the session's dialect, for INSERT ... ON CONFLICT upserts
+    (Postgres in production, SQLite for local runs)
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def async_database_url(url: str):
+    """postgresql://... -> postgresql+asyncpg://..., sqlite://... -> sqlite+aiosqlite://..."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend])
+
+
+def create_async_db_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(async_database_url(url), **_pool_options(url))
+
+
+def pool_stats(engine) -> dict:
+    """Checked-in / checked-out / overflow counts of an engine's connection pool"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    if engine.url.get_backend_name() != "sqlite":
+        stats.update(max_overflow=DB_MAX_OVERFLOW, pre_ping=DB_POOL_PRE_PING, recycle=DB_POOL_RECYCLE)
+    return stats
+
+
+class DBRunner:
+    """
+    Runs session work for an async route handler.
+
+    The work is a plain function taking a (sync) Session, so each query is written once:
+    - DB_ASYNC off: the function runs in the threadpool on a regular Session
+    - DB_ASYNC on: it runs through AsyncSession.run_sync, so the driver I/O (asyncpg /
+      aiosqlite) awaits on the event loop instead of blocking a worker thread
+    Sessions are created on first use, so handlers answered from a cache never check out a connection.
+    Results must be fully loaded inside the function (lazy loads outside it fail in async mode).
+    """
+
+    def __init__(self, session_factory, async_session_factory=None):
+        self._session_factory = session_factory
+        self._async_session_factory = async_session_factory
+        self._session = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._async_session_factory is not None:
+            if self._session is None:
+                self._session = self._async_session_factory()
+            return await self._session.run_sync(fn, *args)
+        if self._session is None:
+            self._session = self._session_factory()
+        return await run_in_threadpool(fn, self._session, *args)
+
+    async def close(self):
+        if self._session is None:
+            return
+        if self._async_session_factory is not None:
+            await self._session.close()
+        else:
+            self._session.close()
+
+
+def runner_dependency(session_factory, async_session_factory: Optional[Any] = None):
+    """FastAPI dependency yielding a DBRunner (see get_db_runner in each database.py)"""
+
+    async def get_db_runner():
+        runner = DBRunner(session_factory, async_session_factory)
+        try:
+            yield runner
+        finally:
+            await runner.close()
+
+    return get_db_runner
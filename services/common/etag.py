@@ -0,0 +1,42 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from version fields, e.g. make_etag(order.id, order.updated_at)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+    """Weak ETag for an already-encoded response body"""
+    return f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (RFC 9110): W/ prefixes are ignored on both sides"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def conditional_json(body: bytes, etag: str, if_none_match: Optional[str], headers: Optional[dict] = None) -> Response:
+    """304 if the client's copy is current, otherwise the encoded JSON body with its ETag"""
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers={**(headers or {}), "ETag": etag})
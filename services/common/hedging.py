@@ -0,0 +1,74 @@
+import random
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LatencyTracker:
+    """
+    Recent successful-call latencies of one service, used to pick the hedge delay.
+
+    The percentile is recomputed every `recompute_every` samples rather than per call.
+    """
+
+    def __init__(self, window: int = 200, percentile: float = 95, min_samples: int = 20, recompute_every: int = 10):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.recompute_every = max(1, recompute_every)
+        self._samples: deque = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+        self._since_recompute = 0
+        self._cached: Optional[float] = None
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._since_recompute += 1
+
+    def value(self) -> Optional[float]:
+        """Latency percentile in seconds, None until `min_samples` calls have been seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._cached is None or self._since_recompute >= self.recompute_every:
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._cached = ordered[index]
+                self._since_recompute = 0
+            return self._cached
+
+
+class RetryBudget:
+    """
+    Token bucket capping extra attempts (retries and hedges) to a share of traffic.
+
+    Every call deposits `ratio` tokens (up to `max_tokens`), every extra attempt costs
+    one. With ratio=0.1 extra attempts stay under ~10% of calls once the initial
+    `max_tokens` burst is spent, so retries cannot multiply load during an outage.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,822 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import requests
+from fastapi import HTTPException
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from common.bulkhead import AdaptiveLimit, Bulkhead, BulkheadFull
+from common.circuit_breaker import ServiceBreaker
+from common.hedging import LatencyTracker, RetryBudget, backoff_delay
+from common.response_cache import CachedResponse, ResponseCache
+from common.single_flight import CoalescedTimeout, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+CB_RESET_TIMEOUT = int(os.getenv("CB_COOLDOWN_SECONDS", "30"))       # Thời gian chờ trước khi thử lại
+CB_ERROR_RATE_THRESHOLD = float(os.getenv("CB_ERROR_RATE", "0.5"))   # Tỷ lệ lỗi: 50% (0.5)
+CB_WINDOW_SIZE = int(os.getenv("CB_WINDOW_SIZE", "10"))              # Số requests để tính tỷ lệ
+CB_MIN_REQUESTS = int(os.getenv("CB_MIN_REQUESTS", "5"))             # Số requests tối thiểu trước khi tính tỷ lệ
+CB_TIME_WINDOW = int(os.getenv("CB_TIME_WINDOW_SECONDS", "0"))       # Cửa sổ thời gian (giây), 0 = tắt
+CB_LOG_INTERVAL = float(os.getenv("CB_LOG_INTERVAL_SECONDS", "10"))  # Log tối đa 1 dòng / service / khoảng này
+CACHE_TTL = int(os.getenv("CACHE_TTL_SECONDS", "300"))               # Cache time-to-live: 5 phút
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))       # Số entry tối đa trong cache
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # Tổng dung lượng tối đa: 16MB
+CACHE_FRESH_SECONDS = float(os.getenv("CACHE_FRESH_SECONDS", "5"))    # Trong thời gian này trả cache, không gọi service
+CACHE_STALE_SECONDS = float(os.getenv("CACHE_STALE_SECONDS", "30"))   # Sau đó: trả cache cũ + refresh nền (hot keys)
+CACHE_HOT_HITS = int(os.getenv("CACHE_HOT_HITS", "3"))                # Số lần hit để coi là hot key
+CACHE_SWEEP_SECONDS = float(os.getenv("CACHE_SWEEP_SECONDS", "60"))   # Chu kỳ dọn entry hết hạn
+
+# Connection pool mặc định cho mỗi service, có thể override bằng HTTP_<SERVICE>_<KEY>
+# (ví dụ HTTP_PRODUCT_POOL_SIZE=50, HTTP_AUTH_READ_TIMEOUT=1)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))                       # Số connection giữ trong pool
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))     # Thời gian giữ connection rảnh (sync và async)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))          # Timeout khi mở connection
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))                # Timeout khi chờ response
+
+# Bulkhead: giới hạn số request đồng thời tới mỗi service để một service chậm không giữ hết worker
+# (override theo service: HTTP_<SERVICE>_MAX_CONCURRENT, HTTP_<SERVICE>_MAX_QUEUE, ...)
+BULKHEAD_MAX_CONCURRENT = int(os.getenv("BULKHEAD_MAX_CONCURRENT", str(HTTP_POOL_SIZE)))  # Số request đang chạy tối đa
+BULKHEAD_MAX_QUEUE = int(os.getenv("BULKHEAD_MAX_QUEUE", "50"))                # Số caller được chờ slot, vượt quá → 503 ngay
+BULKHEAD_QUEUE_TIMEOUT = float(os.getenv("BULKHEAD_QUEUE_TIMEOUT", "1"))       # Thời gian chờ slot tối đa (giây)
+BULKHEAD_ADAPTIVE = os.getenv("BULKHEAD_ADAPTIVE", "false").lower() in ("1", "true", "yes")  # Limit tự điều chỉnh theo latency (AIMD)
+BULKHEAD_MIN_CONCURRENT = int(os.getenv("BULKHEAD_MIN_CONCURRENT", "2"))       # Limit thấp nhất khi adaptive
+BULKHEAD_LATENCY_TOLERANCE = float(os.getenv("BULKHEAD_LATENCY_TOLERANCE", "2"))  # Latency gần đây > 2x baseline → giảm limit
+BULKHEAD_BACKOFF = float(os.getenv("BULKHEAD_BACKOFF", "0.9"))                 # Hệ số giảm limit mỗi lần
+
+# Hedging + retry cho request idempotent (idempotent=True): lần gửi thêm bị giới hạn bởi retry budget
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))          # Gửi request thứ 2 khi chờ lâu hơn p95 latency
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))          # Số mẫu latency tối thiểu trước khi hedge
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.01"))  # Delay hedge tối thiểu (giây)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))         # Tổng số lần gửi (gồm lần đầu) khi lỗi tạm thời
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.05"))  # Backoff: random(0, base * 2^(n-1))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "0.5"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))      # Retry + hedge tối đa ~10% số request
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))  # Burst cho phép
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+_breakers: Dict[str, ServiceBreaker] = {}   # Mỗi service có breaker (và lock) riêng
+_bulkheads: Dict[str, Bulkhead] = {}        # Mỗi service có bulkhead riêng
+_retry_states: Dict[str, "_RetryState"] = {}  # Latency + retry budget của từng service
+_breakers_lock = threading.Lock()
+_response_cache = ResponseCache(         # Cache responses (chỉ lưu status, headers, body)
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=CACHE_TTL,
+    fresh_ttl=CACHE_FRESH_SECONDS,
+    stale_ttl=CACHE_STALE_SECONDS,
+    sweep_interval=CACHE_SWEEP_SECONDS,
+)
+_single_flight = SingleFlight()           # Gộp các GET giống nhau đang chạy đồng thời thành 1 request
+_revalidate_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-revalidate")
+_background_tasks: set = set()           # Giữ reference tới các asyncio task refresh cache
+
+_sessions: Dict[str, requests.Session] = {}          # Pooled session (sync) cho từng service
+_async_clients: Dict[str, httpx.AsyncClient] = {}    # Pooled client (async) cho từng service
+_pool_lock = threading.Lock()
+_pool_requests: Dict[str, int] = {}                  # Số requests đã gửi qua pool
+_async_connections: Dict[str, int] = {}              # Số connection TCP mới mà async client đã mở
+
+
+def _pool_setting(service_name: str, key: str, default: float) -> float:
+    """Đọc cấu hình pool riêng của service (HTTP_<SERVICE>_<KEY>), fallback về mặc định"""
+    env_name = f"HTTP_{service_name.upper().replace('-', '_')}_{key}"
+    return float(os.getenv(env_name, default))
+
+
+def _get_timeout(service_name: str, timeout: Optional[float]) -> Tuple[float, float]:
+    """(connect, read) timeout; timeout truyền vào request_with_cb được dùng làm read timeout"""
+    connect = _pool_setting(service_name, "CONNECT_TIMEOUT", HTTP_CONNECT_TIMEOUT)
+    read = timeout if timeout is not None else _pool_setting(service_name, "READ_TIMEOUT", HTTP_READ_TIMEOUT)
+    return connect, read
+
+
+class _ExpiringPoolMixin:
+    """
+    urllib3 không có keepalive expiry: connection rảnh lâu hơn keepalive_expiry giây
+    bị đóng khi lấy ra khỏi pool và được mở lại (giống httpx keepalive_expiry)
+    """
+
+    def __init__(self, *args, keepalive_expiry: float = HTTP_KEEPALIVE_SECONDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive_expiry = keepalive_expiry
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        idle_since = getattr(conn, "_idle_since", None)
+        if idle_since is not None and time.monotonic() - idle_since > self.keepalive_expiry:
+            conn.close()  # Request tiếp theo tự connect lại trên object này
+            self.num_connections += 1  # Tính là connection mới trong get_pool_stats
+        conn._idle_since = None
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn._idle_since = time.monotonic()
+        super()._put_conn(conn)
+
+
+class _ExpiringHTTPConnectionPool(_ExpiringPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _ExpiringHTTPSConnectionPool(_ExpiringPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter áp dụng HTTP_<SERVICE>_KEEPALIVE_SECONDS cho connection pool sync"""
+
+    def __init__(self, keepalive_expiry: float, **kwargs):
+        self.keepalive_expiry = keepalive_expiry  # Gán trước: HTTPAdapter.__init__ gọi init_poolmanager
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": partial(_ExpiringHTTPConnectionPool, keepalive_expiry=self.keepalive_expiry),
+            "https": partial(_ExpiringHTTPSConnectionPool, keepalive_expiry=self.keepalive_expiry),
+        }
+
+
+def get_session(service_name: str) -> requests.Session:
+    """Lấy (hoặc tạo) requests.Session dùng keep-alive connection pool riêng cho service"""
+    session = _sessions.get(service_name)
+    if session is None:
+        with _pool_lock:
+            session = _sessions.get(service_name)
+            if session is None:
+                pool_size = int(_pool_setting(service_name, "POOL_SIZE", HTTP_POOL_SIZE))
+                keepalive = _pool_setting(service_name, "KEEPALIVE_SECONDS", HTTP_KEEPALIVE_SECONDS)
+                adapter = _KeepAliveAdapter(keepalive, pool_connections=1, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[service_name] = session
+    return session
+
+
+def get_async_client(service_name: str) -> httpx.AsyncClient:
+    """Lấy (hoặc tạo) httpx.AsyncClient dùng keep-alive connection pool riêng cho service"""
+    client = _async_clients.get(service_name)
+    if client is None:
+        pool_size = int(_pool_setting(service_name, "POOL_SIZE", HTTP_POOL_SIZE))
+        keepalive = _pool_setting(service_name, "KEEPALIVE_SECONDS", HTTP_KEEPALIVE_SECONDS)
+        connect, read = _get_timeout(service_name, None)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive,
+            ),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+        _async_clients[service_name] = client
+    return client
+
+
+def _count_request(service_name: str):
+    with _pool_lock:
+        _pool_requests[service_name] = _pool_requests.get(service_name, 0) + 1
+
+
+async def _trace_connections(service_name: str, event_name: str, info: dict):
+    """httpcore trace hook: đếm số connection TCP mới được mở"""
+    if event_name == "connection.connect_tcp.complete":
+        _async_connections[service_name] = _async_connections.get(service_name, 0) + 1
+
+
+def _sync_connections(service_name: str) -> int:
+    session = _sessions.get(service_name)
+    if session is None:
+        return 0
+    adapter = session.get_adapter("http://")
+    pools = adapter.poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    """Thống kê mức độ tái sử dụng connection của từng service"""
+    stats = {}
+    for service_name, total in list(_pool_requests.items()):
+        connections = _sync_connections(service_name) + _async_connections.get(service_name, 0)
+        reused = max(total - connections, 0)
+        stats[service_name] = {
+            "requests": total,
+            "connections_opened": connections,
+            "reused": reused,
+            "reuse_ratio": round(reused / total, 3) if total else 0.0,
+        }
+    return stats
+
+
+def close_sessions():
+    """Đóng tất cả sync sessions (gọi khi shutdown)"""
+    with _pool_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+async def aclose_clients():
+    """Đóng tất cả async clients (gọi khi shutdown)"""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
+
+
+def _get_breaker(name: str) -> ServiceBreaker:
+    """
+    Lấy (hoặc tạo) circuit breaker của service với cấu hình:
+    - Cửa sổ CB_WINDOW_SIZE requests gần nhất (và tùy chọn CB_TIME_WINDOW_SECONDS giây)
+    - reset_timeout: Thời gian chờ trước khi thử lại (HALF_OPEN)
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = ServiceBreaker(
+                    name,
+                    window_size=CB_WINDOW_SIZE,
+                    min_requests=CB_MIN_REQUESTS,
+                    error_rate=CB_ERROR_RATE_THRESHOLD,
+                    reset_timeout=CB_RESET_TIMEOUT,
+                    time_window=CB_TIME_WINDOW,
+                    log_interval=CB_LOG_INTERVAL,
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def _get_bulkhead(name: str) -> Bulkhead:
+    """Lấy (hoặc tạo) bulkhead của service (giới hạn tĩnh, hoặc adaptive nếu BULKHEAD_ADAPTIVE)"""
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        with _breakers_lock:
+            bulkhead = _bulkheads.get(name)
+            if bulkhead is None:
+                max_concurrent = int(_pool_setting(name, "MAX_CONCURRENT", BULKHEAD_MAX_CONCURRENT))
+                adaptive = None
+                if BULKHEAD_ADAPTIVE:
+                    adaptive = AdaptiveLimit(
+                        initial=max_concurrent,
+                        min_limit=int(_pool_setting(name, "MIN_CONCURRENT", BULKHEAD_MIN_CONCURRENT)),
+                        max_limit=max_concurrent,
+                        tolerance=BULKHEAD_LATENCY_TOLERANCE,
+                        backoff=BULKHEAD_BACKOFF,
+                    )
+                bulkhead = Bulkhead(
+                    name,
+                    max_concurrent=max_concurrent,
+                    max_queue=int(_pool_setting(name, "MAX_QUEUE", BULKHEAD_MAX_QUEUE)),
+                    queue_timeout=_pool_setting(name, "QUEUE_TIMEOUT", BULKHEAD_QUEUE_TIMEOUT),
+                    adaptive=adaptive,
+                )
+                _bulkheads[name] = bulkhead
+    return bulkhead
+
+
+def get_bulkhead_stats() -> Dict[str, dict]:
+    """Số request đang chạy / đang chờ, limit hiện tại và số request bị từ chối của từng service"""
+    return {name: bulkhead.stats() for name, bulkhead in list(_bulkheads.items())}
+
+
+@dataclass
+class _RetryState:
+    latency: LatencyTracker
+    budget: RetryBudget
+    stats: Dict[str, int] = field(default_factory=lambda: {
+        "calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "budget_exhausted": 0,
+    })
+    # Counter được cập nhật từ nhiều thread (sync client) lẫn event loop
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def incr(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+
+def _get_retry_state(name: str) -> _RetryState:
+    state = _retry_states.get(name)
+    if state is None:
+        with _breakers_lock:
+            state = _retry_states.get(name)
+            if state is None:
+                state = _RetryState(
+                    latency=LatencyTracker(percentile=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES),
+                    budget=RetryBudget(ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX_TOKENS),
+                )
+                _retry_states[name] = state
+    return state
+
+
+def get_retry_stats() -> Dict[str, dict]:
+    """Số lần retry / hedge (và số lần hedge thắng), token còn lại trong retry budget, delay hedge hiện tại"""
+    stats = {}
+    for name, state in list(_retry_states.items()):
+        delay = state.latency.value()
+        stats[name] = {
+            **state.snapshot(),
+            "budget_tokens": round(state.budget.tokens, 2),
+            "hedge_delay_ms": round(max(delay, HEDGE_MIN_DELAY) * 1000, 1) if delay is not None else None,
+        }
+    return stats
+
+
+def _withdraw_extra_attempt(state: _RetryState, kind: str) -> bool:
+    if not state.budget.withdraw():
+        state.incr("budget_exhausted")
+        return False
+    state.incr(kind)
+    return True
+
+
+def _send_with_retries(state: _RetryState, attempt_fn, attempts: int):
+    """
+    Gọi attempt_fn() tối đa `attempts` lần khi lỗi kết nối / 502-504, backoff có jitter;
+    mỗi lần retry tốn 1 token của retry budget (hết token → trả kết quả lần cuối)
+    """
+    for attempt in range(1, attempts + 1):
+        error, resp = None, None
+        try:
+            resp = attempt_fn()
+        except requests.RequestException as exc:
+            error = exc
+        if (resp is not None and resp.status_code not in RETRYABLE_STATUSES) or attempt == attempts:
+            break
+        if not _withdraw_extra_attempt(state, "retries"):
+            break
+        time.sleep(backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+    if error is not None:
+        raise error
+    return resp
+
+
+async def _asend_with_retries(state: _RetryState, attempt_fn, attempts: int):
+    """Phiên bản async của _send_with_retries"""
+    for attempt in range(1, attempts + 1):
+        error, resp = None, None
+        try:
+            resp = await attempt_fn()
+        except httpx.RequestError as exc:
+            error = exc
+        if (resp is not None and resp.status_code not in RETRYABLE_STATUSES) or attempt == attempts:
+            break
+        if not _withdraw_extra_attempt(state, "retries"):
+            break
+        await asyncio.sleep(backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+    if error is not None:
+        raise error
+    return resp
+
+
+async def _ahedged(state: _RetryState, attempt_fn):
+    """
+    Gửi request; nếu chưa có kết quả sau percentile HEDGE_PERCENTILE latency của service thì gửi
+    thêm 1 request (tốn 1 token retry budget) và lấy kết quả về trước, hủy request còn lại
+    """
+    delay = state.latency.value() if HEDGE_ENABLED else None
+    tasks = [asyncio.ensure_future(attempt_fn())]
+    try:
+        if delay is None:
+            return await tasks[0]
+        done, _ = await asyncio.wait(tasks, timeout=max(delay, HEDGE_MIN_DELAY))
+        if done or not _withdraw_extra_attempt(state, "hedges"):
+            return await tasks[0]
+        tasks.append(asyncio.ensure_future(attempt_fn()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        state.incr("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # Đánh dấu đã xử lý exception của request thua
+
+
+def get_breaker_stats() -> Dict[str, dict]:
+    """Trạng thái circuit và tỷ lệ lỗi của từng service"""
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
+
+
+def _get_cache_key(service_name: str, method: str, path: str, kwargs: Dict) -> str:
+    """Tạo cache key từ request parameters"""
+    # Chỉ cache GET requests
+    if method.lower() != "get":
+        return None
+    
+    params_str = str(kwargs.get("params", ""))
+    return f"{service_name}:{method}:{path}:{params_str}"
+
+
+def _get_cached_response(cache_key: str) -> Optional[CachedResponse]:
+    """Lấy cached response (còn trong CACHE_TTL) để làm fallback"""
+    if not cache_key:
+        return None
+    cached, _, _ = _response_cache.lookup(cache_key)
+    if cached is None:
+        return None
+
+    _response_cache.record("fallback_hits")
+    return cached
+
+
+def _cache_response(cache_key: str, response):
+    """Cache response nếu là GET request thành công"""
+    if cache_key and response.status_code == 200:
+        _response_cache.set(cache_key, CachedResponse.from_response(response))
+
+
+def _add_validator(cache_key: Optional[str], kwargs: Dict) -> Optional[CachedResponse]:
+    """
+    Nếu cache còn entry có ETag → gửi kèm If-None-Match để service trả 304 thay vì cả body.
+    Returns entry được revalidate (None nếu không có).
+    """
+    if not cache_key:
+        return None
+    cached = _response_cache.peek(cache_key)
+    if cached is None or "etag" not in cached.headers:
+        return None
+    kwargs["headers"] = {**(kwargs.get("headers") or {}), "If-None-Match": cached.headers["etag"]}
+    return cached
+
+
+def _lookup_fresh(cache_key: Optional[str]) -> Tuple[Optional[CachedResponse], bool]:
+    """
+    Tìm response có thể trả ngay mà không gọi service.
+    Returns (cached, needs_refresh):
+    - Entry còn fresh → (cached, False)
+    - Entry stale nhưng là hot key → (cached, True): trả cache cũ, refresh ở nền
+    - Còn lại → (None, False): phải gọi service
+    """
+    if not cache_key:
+        return None, False
+    cached, state, hits = _response_cache.lookup(cache_key)
+    if state == "fresh":
+        _response_cache.record("hits")
+        return cached, False
+    if state == "stale" and hits >= CACHE_HOT_HITS:
+        _response_cache.record("stale_hits")
+        return cached, _response_cache.begin_revalidation(cache_key)
+    _response_cache.record("misses")
+    return None, False
+
+
+def get_cache_stats() -> dict:
+    """Thống kê response cache (hit, miss, eviction, dung lượng)"""
+    return _response_cache.stats()
+
+
+def get_coalescing_stats() -> dict:
+    """Số GET đã gửi (leaders), số lời gọi dùng chung kết quả (coalesced), số lần chờ quá hạn"""
+    return _single_flight.stats()
+
+
+def _coalesce_timeout(service_name: str, timeout: Optional[float], attempts: int = 1) -> float:
+    """Thời gian tối đa một caller chờ request đang chạy: bằng ngân sách của chính nó (connect + read mỗi lần gửi)"""
+    connect, read = _get_timeout(service_name, timeout)
+    return (connect + read) * attempts + (RETRY_MAX_DELAY * (attempts - 1))
+
+
+def _coalesced_timeout_fallback(service_name: str, cache_key: str, use_fallback: bool):
+    """Chờ request đang chạy quá lâu → trả cache nếu có, ngược lại 504 (không tính vào circuit breaker)"""
+    if use_fallback:
+        cached = _get_cached_response(cache_key)
+        if cached:
+            return cached
+    raise HTTPException(
+        status_code=504,
+        detail=f"{service_name}: timed out waiting for an identical in-flight request. No cached data available.",
+    )
+
+
+def _guard_circuit(service_name: str, cache_key: Optional[str], use_fallback: bool):
+    """
+    Kiểm tra circuit trước khi gọi service.
+    Returns cached response nếu circuit OPEN và có fallback, None nếu được phép gọi.
+    Raise HTTPException 503 nếu circuit OPEN và không có cache.
+    """
+    breaker = _get_breaker(service_name)
+    if breaker.allow_request():
+        return None
+
+    # Circuit đang OPEN → thử dùng cached response
+    if use_fallback and cache_key:
+        cached = _get_cached_response(cache_key)
+        if cached:
+            breaker.log(f"{service_name}: Circuit OPEN, using cached response")
+            return cached
+
+    # Không có cache hoặc không phải GET request
+    raise HTTPException(
+        status_code=503,
+        detail=f"Circuit OPEN for {service_name}: Error rate {breaker.error_rate():.0%} exceeded threshold {CB_ERROR_RATE_THRESHOLD:.0%}. No cached data available."
+    )
+
+
+def _handle_success(service_name: str, cache_key: Optional[str], resp, revalidated: Optional[CachedResponse] = None):
+    """
+    Cache response, ghi nhận success (đóng circuit nếu đang HALF_OPEN).
+    304 Not Modified → entry trong cache vẫn đúng: làm mới tuổi của nó và trả entry đó.
+    """
+    _get_breaker(service_name).record_success()
+    if revalidated is not None and resp.status_code == 304:
+        _response_cache.set(cache_key, revalidated)
+        _response_cache.record("not_modified")
+        return revalidated
+    _cache_response(cache_key, resp)
+    return resp
+
+
+def _handle_shed(service_name: str, cache_key: Optional[str], use_fallback: bool, exc: BulkheadFull):
+    """Bulkhead đầy → trả cache nếu có, ngược lại 503 ngay (không tính vào circuit breaker)"""
+    if use_fallback and cache_key:
+        cached = _get_cached_response(cache_key)
+        if cached:
+            return cached
+    raise HTTPException(status_code=503, detail=f"Too many concurrent requests to {exc}. No cached data available.")
+
+
+def _handle_failure(service_name: str, cache_key: Optional[str], use_fallback: bool, exc: Exception):
+    """Ghi nhận failure, trả về cached response nếu có, ngược lại raise 502"""
+    breaker = _get_breaker(service_name)
+    breaker.record_failure()
+
+    # Thử dùng cached response
+    if use_fallback and cache_key:
+        cached = _get_cached_response(cache_key)
+        if cached:
+            breaker.log(f"{service_name}: Service unreachable, using cached response")
+            return cached
+
+    raise HTTPException(
+        status_code=502,
+        detail=f"{service_name} unreachable: {exc}. No cached data available."
+    )
+
+
+def request_with_cb(
+    service_name: str,
+    base_url: str,
+    method: str,
+    path: str,
+    *,
+    timeout: Optional[float] = None,
+    use_fallback: bool = True,
+    use_cache: bool = True,
+    idempotent: bool = False,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    Gọi HTTP request với Circuit Breaker protection và Fallback strategy.
+    
+    Cơ chế Circuit Breaker:
+    - Tính tỷ lệ lỗi trong sliding window (CB_WINDOW_SIZE requests gần nhất,
+      và CB_TIME_WINDOW_SECONDS giây gần nhất nếu bật)
+    - Nếu error_rate >= CB_ERROR_RATE_THRESHOLD → Circuit OPEN
+    - Circuit OPEN: Chặn tất cả requests
+    - Sau CB_RESET_TIMEOUT giây: Circuit HALF-OPEN, thử 1 request
+    - Request thành công → Circuit CLOSED, thất bại → Circuit OPEN lại
+    
+    Fallback Strategy:
+    - Khi circuit OPEN hoặc service unreachable:
+      * GET requests: Trả về cached response (nếu có)
+      * POST/PUT/DELETE: Raise exception (không thể dùng cache)
+    - Cache TTL: CACHE_TTL_SECONDS (mặc định 5 phút)
+
+    Response Cache (GET):
+    - Tuổi < CACHE_FRESH_SECONDS: trả cache, không gọi service
+    - Tuổi < CACHE_FRESH_SECONDS + CACHE_STALE_SECONDS và là hot key: trả cache cũ,
+      refresh ở nền (stale-while-revalidate)
+    - Cache bị giới hạn bởi CACHE_MAX_ENTRIES và CACHE_MAX_BYTES (LRU)
+    - Entry hết fresh nhưng có ETag: gửi If-None-Match, service trả 304 → dùng lại entry
+      (chỉ tốn một round trip header, không tải lại và parse lại body)
+
+    Bulkhead (mỗi service):
+    - Tối đa BULKHEAD_MAX_CONCURRENT request đang chạy; caller vượt quá chờ trong hàng đợi
+      (tối đa BULKHEAD_MAX_QUEUE caller, BULKHEAD_QUEUE_TIMEOUT giây)
+    - Hàng đợi đầy hoặc chờ quá hạn → cache fallback hoặc 503 ngay
+    - BULKHEAD_ADAPTIVE: limit giảm khi latency tăng hoặc request lỗi, tăng dần khi ổn định
+
+    Single-flight (GET):
+    - Các lời gọi đồng thời có cùng cache key chỉ gửi 1 request; các caller đến sau
+      chờ và nhận cùng response (hoặc cùng exception)
+    - Mỗi caller chờ tối đa connect + read timeout của mình, quá hạn → cache fallback
+      hoặc 504
+
+    Hedging + retry (chỉ khi idempotent=True, ví dụ GET /products/{id}, GET /customers/{id}):
+    - Lỗi kết nối hoặc 502/503/504 → gửi lại, tối đa RETRY_MAX_ATTEMPTS lần, backoff có jitter
+    - Async: sau percentile HEDGE_PERCENTILE latency của service mà chưa có response → gửi thêm
+      1 request, lấy response về trước
+    - Retry và hedge đều tốn token của retry budget (~RETRY_BUDGET_RATIO số request),
+      nên không nhân tải lên service đang lỗi
+    
+    Args:
+        service_name: Tên service (để tracking circuit state)
+        base_url: Base URL của service
+        method: HTTP method (GET, POST, PUT, DELETE)
+        path: Request path
+        timeout: Read timeout (giây); mặc định lấy theo cấu hình pool của service
+        use_fallback: Có sử dụng fallback strategy không (mặc định True)
+        use_cache: Có trả response từ cache khi còn fresh không (mặc định True)
+        idempotent: Request gửi nhiều lần cũng an toàn → bật retry / hedging (mặc định False)
+        **kwargs: Các tham số khác cho requests.request()
+    
+    Returns:
+        requests.Response object
+        
+    Raises:
+        HTTPException: Khi service không khả dụng và không có fallback
+    """
+    url = f"{base_url}{path}"
+    cache_key = _get_cache_key(service_name, method, path, kwargs)
+    state = _get_retry_state(service_name)
+    attempts = max(1, RETRY_MAX_ATTEMPTS) if idempotent else 1
+
+    if use_cache:
+        cached, needs_refresh = _lookup_fresh(cache_key)
+        if needs_refresh:
+            _revalidate_executor.submit(
+                _refresh, service_name, base_url, method, path, cache_key, timeout, kwargs
+            )
+        if cached is not None:
+            return cached
+
+    def send():
+        cached = _guard_circuit(service_name, cache_key, use_fallback)
+        if cached is not None:
+            return cached
+        bulkhead = _get_bulkhead(service_name)
+        try:
+            bulkhead.acquire()
+        except BulkheadFull as exc:
+            return _handle_shed(service_name, cache_key, use_fallback, exc)
+        revalidated = _add_validator(cache_key, kwargs)
+        state.incr("calls")
+        if idempotent:
+            state.budget.deposit()
+
+        def attempt():
+            # Gọi service qua pooled session (keep-alive)
+            _count_request(service_name)
+            attempt_started = time.monotonic()
+            resp = get_session(service_name).request(
+                method=method, url=url, timeout=_get_timeout(service_name, timeout), **kwargs
+            )
+            if resp.status_code < 500:
+                state.latency.record(time.monotonic() - attempt_started)
+            return resp
+
+        started = time.monotonic()
+        try:
+            resp = _send_with_retries(state, attempt, attempts)
+        except requests.RequestException as exc:
+            bulkhead.release(time.monotonic() - started, failed=True)
+            return _handle_failure(service_name, cache_key, use_fallback, exc)
+        except BaseException:
+            bulkhead.release()
+            raise
+        bulkhead.release(time.monotonic() - started, failed=resp.status_code >= 500)
+
+        return _handle_success(service_name, cache_key, resp, revalidated)
+
+    if not cache_key:
+        return send()
+    try:
+        # GET giống hệt đang chạy (cùng cache key) → chờ và dùng chung kết quả
+        return _single_flight.do(cache_key, send, _coalesce_timeout(service_name, timeout, attempts))
+    except CoalescedTimeout:
+        return _coalesced_timeout_fallback(service_name, cache_key, use_fallback)
+
+
+async def async_request_with_cb(
+    service_name: str,
+    base_url: str,
+    method: str,
+    path: str,
+    *,
+    timeout: Optional[float] = None,
+    use_fallback: bool = True,
+    use_cache: bool = True,
+    idempotent: bool = False,
+    **kwargs: Any,
+) -> httpx.Response:
+    """
+    Phiên bản asyncio của request_with_cb (dùng pooled httpx.AsyncClient của service).
+
+    Dùng chung circuit state, sliding window và response cache với request_with_cb,
+    nên các lời gọi sync và async tới cùng một service được tính chung tỷ lệ lỗi.
+    Tham số giống hệt request_with_cb; **kwargs được truyền cho httpx.AsyncClient.request().
+    """
+    url = f"{base_url}{path}"
+    cache_key = _get_cache_key(service_name, method, path, kwargs)
+    state = _get_retry_state(service_name)
+    attempts = max(1, RETRY_MAX_ATTEMPTS) if idempotent else 1
+
+    if use_cache:
+        cached, needs_refresh = _lookup_fresh(cache_key)
+        if needs_refresh:
+            task = asyncio.create_task(
+                _arefresh(service_name, base_url, method, path, cache_key, timeout, kwargs)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        if cached is not None:
+            return cached
+
+    async def send():
+        cached = _guard_circuit(service_name, cache_key, use_fallback)
+        if cached is not None:
+            return cached
+        bulkhead = _get_bulkhead(service_name)
+        try:
+            await bulkhead.aacquire()
+        except BulkheadFull as exc:
+            return _handle_shed(service_name, cache_key, use_fallback, exc)
+        revalidated = _add_validator(cache_key, kwargs)
+        state.incr("calls")
+        if idempotent:
+            state.budget.deposit()
+
+        async def attempt():
+            _count_request(service_name)
+            attempt_started = time.monotonic()
+            connect, read = _get_timeout(service_name, timeout)
+            resp = await get_async_client(service_name).request(
+                method=method,
+                url=url,
+                timeout=httpx.Timeout(read, connect=connect),
+                extensions={"trace": partial(_trace_connections, service_name)},
+                **kwargs,
+            )
+            if resp.status_code < 500:
+                state.latency.record(time.monotonic() - attempt_started)
+            return resp
+
+        async def hedged_attempt():
+            return await _ahedged(state, attempt)
+
+        started = time.monotonic()
+        try:
+            resp = await _asend_with_retries(state, hedged_attempt if idempotent else attempt, attempts)
+        except httpx.RequestError as exc:
+            bulkhead.release(time.monotonic() - started, failed=True)
+            return _handle_failure(service_name, cache_key, use_fallback, exc)
+        except BaseException:
+            # Cancelled: gives the slot back without a latency sample
+            bulkhead.release()
+            raise
+        bulkhead.release(time.monotonic() - started, failed=resp.status_code >= 500)
+
+        return _handle_success(service_name, cache_key, resp, revalidated)
+
+    if not cache_key:
+        return await send()
+    try:
+        return await _single_flight.ado(cache_key, send, _coalesce_timeout(service_name, timeout, attempts))
+    except CoalescedTimeout:
+        return _coalesced_timeout_fallback(service_name, cache_key, use_fallback)
+
+
+def _refresh(service_name: str, base_url: str, method: str, path: str, cache_key: str, timeout, kwargs: Dict):
+    """Refresh một cache entry ở nền (stale-while-revalidate)"""
+    try:
+        request_with_cb(service_name, base_url, method, path, timeout=timeout, use_cache=False, **kwargs)
+    except Exception as exc:
+        logger.warning(f"[Cache] Background refresh failed for {cache_key}: {exc}")
+    finally:
+        _response_cache.end_revalidation(cache_key)
+
+
+async def _arefresh(service_name: str, base_url: str, method: str, path: str, cache_key: str, timeout, kwargs: Dict):
+    """Phiên bản async của _refresh"""
+    try:
+        await async_request_with_cb(service_name, base_url, method, path, timeout=timeout, use_cache=False, **kwargs)
+    except Exception as exc:
+        logger.warning(f"[Cache] Background refresh failed for {cache_key}: {exc}")
+    finally:
+        _response_cache.end_revalidation(cache_key)
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (value, stored_at)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, max_age: Optional[float] = None):
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] < max_age:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None and time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
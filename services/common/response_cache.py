@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from requests.structures import CaseInsensitiveDict
+
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+class CachedResponse:
+    """
+    Lightweight copy of an HTTP response (status, headers, body only).
+    Exposes the subset of the requests/httpx Response API the services use.
+    """
+
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @classmethod
+    def from_response(cls, resp) -> "CachedResponse":
+        # Body is stored decoded, so transfer/encoding headers no longer apply
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in _DROPPED_HEADERS}
+        return cls(resp.status_code, headers, resp.content)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache bounded by entry count and total bytes.
+
+    Each entry has three ages:
+    - fresh (< fresh_ttl): can be served without calling the service
+    - stale (< fresh_ttl + stale_ttl): can be served while a refresh runs in the background
+    - retained (< ttl): only used as a fallback when the service is unavailable
+    Expired entries are removed on access and by a periodic background sweep.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        fresh_ttl: float,
+        stale_ttl: float,
+        sweep_interval: float = 60.0,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.sweep_interval = sweep_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # {key: (response, stored_at, hits, size)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._revalidating: set = set()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "fallback_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "revalidations": 0,
+            "not_modified": 0,
+        }
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], str, int]:
+        """
+        Returns (response, state, hits) where state is "fresh", "stale", "retained" or "miss".
+        Does not count as a hit; callers record how the entry was used.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, "miss", 0
+            resp, stored_at, hits, size = entry
+            age = now - stored_at
+            if age > self.ttl:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                return None, "miss", 0
+            self._entries[key] = (resp, stored_at, hits + 1, size)
+            self._entries.move_to_end(key)
+        if age < self.fresh_ttl:
+            return resp, "fresh", hits + 1
+        if age < self.fresh_ttl + self.stale_ttl:
+            return resp, "stale", hits + 1
+        return resp, "retained", hits + 1
+
+    def peek(self, key: str) -> Optional[CachedResponse]:
+        """Unexpired entry for `key` without touching hit counts or LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def record(self, outcome: str):
+        """Count a lookup outcome: hits, stale_hits, fallback_hits, misses or not_modified"""
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def set(self, key: str, resp: CachedResponse):
+        size = resp.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            hits = 0
+            if key in self._entries:
+                hits = self._entries[key][2]
+                self._remove(key)
+            self._entries[key] = (resp, time.time(), hits, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+        self._ensure_sweeper()
+
+    def begin_revalidation(self, key: str) -> bool:
+        """Claim a background refresh for `key`; False if one is already running"""
+        with self._lock:
+            if key in self._revalidating:
+                return False
+            self._revalidating.add(key)
+            self._stats["revalidations"] += 1
+            return True
+
+    def end_revalidation(self, key: str):
+        with self._lock:
+            self._revalidating.discard(key)
+
+    def sweep(self):
+        """Remove every entry older than ttl"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[1] < cutoff]
+            for key in expired:
+                self._remove(key)
+            self._stats["expirations"] += len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+            )
+
+    def _remove(self, key: str):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="response-cache-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
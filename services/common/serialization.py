@@ -0,0 +1,179 @@
+import gzip
+import os
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Union, get_args, get_origin
+
+import orjson
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))          # Smaller bodies are sent as-is
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))  # 4-5 is close to gzip -6 in CPU, smaller output
+
+_COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def _default(value: Any):
+    # Numeric(10, 2) columns come back as Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (Decimal and datetime supported)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _nested_model(annotation) -> tuple[Optional[type], bool]:
+    """(model, is_list) if the field holds a pydantic model or a list of them"""
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        annotation = args[0] if len(args) == 1 else annotation
+    if get_origin(annotation) in (list, tuple):
+        inner = get_args(annotation)[0] if get_args(annotation) else None
+        if isinstance(inner, type) and issubclass(inner, BaseModel):
+            return inner, True
+        return None, False
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+
+@lru_cache(maxsize=None)
+def _field_plan(model: type) -> tuple:
+    plan = []
+    for name, field in model.model_fields.items():
+        nested, many = _nested_model(field.annotation)
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        plan.append((name, nested, many, default))
+    return tuple(plan)
+
+
+def dump_trusted(obj: Any, model: type) -> dict:
+    """
+    Dump an ORM row (or a dict built by the service) following `model`'s fields without
+    pydantic validation. Only for data the service produced itself; values are emitted as stored.
+    """
+    item = {}
+    if isinstance(obj, dict):
+        loaded = obj
+    else:
+        loaded = getattr(obj, "__dict__", {})  # Loaded column values, read without the attribute descriptors
+    for name, nested, many, default in _field_plan(model):
+        value = loaded[name] if name in loaded else getattr(obj, name, default)
+        if nested is not None and value is not None:
+            value = [dump_trusted(v, nested) for v in value] if many else dump_trusted(value, nested)
+        item[name] = value
+    return item
+
+
+def trusted_response(
+    rows: Union[Any, Iterable[Any]],
+    model: type,
+    status_code: int = 200,
+    headers: Optional[dict] = None,
+) -> Response:
+    """Fast path for response_model routes returning ORM rows: dump_trusted + orjson"""
+    if isinstance(rows, (list, tuple)):
+        content = [dump_trusted(row, model) for row in rows]
+    else:
+        content = dump_trusted(rows, model)
+    return Response(content=dumps(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Brotli / gzip compression for JSON and text responses of at least `minimum_size` bytes.
+    Brotli is preferred when the client accepts it and the package is installed.
+    Streaming responses (more than one body chunk) are passed through unchanged.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESS_MIN_SIZE,
+        gzip_level: int = COMPRESS_GZIP_LEVEL,
+        brotli_quality: int = COMPRESS_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(_COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            body = _compress(body, encoding, self.gzip_level, self.brotli_quality)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
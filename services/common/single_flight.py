@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class CoalescedTimeout(Exception):
+    """Raised to a caller that waited longer than its timeout for a shared in-flight call"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first caller for a key (the leader) runs the call; callers arriving while it is
+    in flight wait for it and get the same result or exception. Nothing is kept once the
+    call finishes (caching is the response cache's job). Threads use do(), asyncio tasks
+    use ado(); the two never share a call.
+
+    Each waiter is bounded by its own timeout. In ado() the call runs as a separate task,
+    so a leader that is cancelled or times out does not fail the other waiters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._stats["leaders" if leader else "coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as exc:
+                call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            self._incr("timeouts")
+            raise CoalescedTimeout(key)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = loop.create_task(fn())
+            self._tasks[task_key] = task
+            task.add_done_callback(_forget_when_done(self._tasks, task_key))
+            self._incr("leaders")
+        else:
+            self._incr("coalesced")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self._incr("timeouts")
+            raise CoalescedTimeout(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls) + len(self._tasks)}
+
+    def _incr(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def _forget_when_done(tasks: Dict[tuple, asyncio.Task], task_key: tuple):
+    def done(task: asyncio.Task):
+        if tasks.get(task_key) is task:
+            del tasks[task_key]
+        # Every waiter may have timed out: mark the exception as retrieved
+        if not task.cancelled():
+            task.exception()
+
+    return done
@@ -1,10 +1,26 @@
-from fastapi import FastAPI, HTTPException, Depends
+import os
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import get_db, Customer as DBCustomer
+from common.etag import conditional_json, etag_matches, make_etag, not_modified
+from common.lru import LRUCache
+from common.serialization import CompressionMiddleware, FastJSONResponse, dumps
+from common.db import DBRunner
+from database import get_db_runner, pool_stats, Customer as DBCustomer
+
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "10000"))   # Max customer rows cached
+CUSTOMER_CACHE_TTL = float(os.getenv("CUSTOMER_CACHE_TTL", "60"))      # Row TTL (seconds)
+CUSTOMER_BATCH_MAX = int(os.getenv("CUSTOMER_BATCH_MAX", "500"))       # Max ids per batch lookup
+
+# Serialized customer rows keyed by id; customer-service has no write routes, so the TTL bounds staleness
+customer_cache = LRUCache(CUSTOMER_CACHE_SIZE, CUSTOMER_CACHE_TTL)
 
-app = FastAPI(title="Customer Service")
+app = FastAPI(title="Customer Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +28,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
@@ -26,14 +43,90 @@ class Customer(BaseModel):
         from_attributes = True
 
 
+class CustomerBatch(BaseModel):
+    ids: List[str]
+
+
+def _customer_dict(row) -> dict:
+    return {"id": row.id, "name": row.name, "email": row.email, "phone": row.phone, "address": row.address}
+
+
+def _fetch_customers(db: Session, customer_ids: List[str]) -> List[dict]:
+    rows = db.query(DBCustomer).filter(DBCustomer.id.in_(customer_ids)).all()
+    customers = [_customer_dict(row) for row in rows]
+    for customer in customers:
+        customer_cache.set(customer["id"], customer)
+    return customers
+
+
+async def _customers_by_ids(db: DBRunner, customer_ids: List[str]) -> List[dict]:
+    """Cached rows first, the rest with one WHERE id IN (...); unknown ids are left out"""
+    customer_ids = sorted({cid for cid in customer_ids if cid})
+    if len(customer_ids) > CUSTOMER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {CUSTOMER_BATCH_MAX} ids per request")
+    customers, missing = [], []
+    for customer_id in customer_ids:
+        cached = customer_cache.get(customer_id)
+        if cached is None:
+            missing.append(customer_id)
+        else:
+            customers.append(cached)
+    if missing:
+        customers += await db.run(_fetch_customers, missing)
+    customers.sort(key=lambda c: c["id"])
+    return customers
+
+
+def _batch_response(customers: List[dict], if_none_match: str | None) -> Response:
+    body = dumps(customers)
+    return conditional_json(body, make_etag(*[tuple(c.values()) for c in customers]), if_none_match)
+
+
+@app.get("/customers", response_model=List[Customer])
+async def list_customers(
+    ids: str = Query(description="Comma-separated customer ids, e.g. 12345,67890"),
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    customers = await _customers_by_ids(db, [part.strip() for part in ids.split(",")])
+    return _batch_response(customers, if_none_match)
+
+
+@app.post("/customers/batch", response_model=List[Customer])
+async def batch_customers(
+    payload: CustomerBatch,
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    """Same as GET /customers?ids=... for id lists too long for a query string"""
+    customers = await _customers_by_ids(db, payload.ids)
+    return _batch_response(customers, if_none_match)
+
+
 @app.get("/customers/{customer_id}", response_model=Customer)
-def get_customer(customer_id: str, db: Session = Depends(get_db)):
-    customer = db.query(DBCustomer).filter(DBCustomer.id == customer_id).first()
-    if not customer:
+async def get_customer(
+    customer_id: str,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    customers = await _customers_by_ids(db, [customer_id])
+    if not customers:
         raise HTTPException(status_code=404, detail="Customer not found")
+    customer = customers[0]
+    # customers has no updated_at column, so the ETag covers the returned fields
+    etag = make_etag(*customer.values())
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return customer
 
 
+@app.get("/metrics")
+def metrics():
+    return {"db_pool": pool_stats(), "customer_cache": customer_cache.stats()}
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -1,16 +1,42 @@
+import asyncio
+import logging
 import os
+import uuid
+from datetime import datetime
 from typing import List
 
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from common.auth import get_cache_stats as get_auth_cache_stats, verify_bearer
+from common.event_publisher import PublisherBackpressure, PublisherUnavailable, get_publisher, publish_event
+from common.http_client import (
+    aclose_clients,
+    async_request_with_cb,
+    close_sessions,
+    get_breaker_stats,
+    get_bulkhead_stats,
+    get_cache_stats,
+    get_coalescing_stats,
+    get_pool_stats,
+    get_retry_stats,
+)
+from common.serialization import CompressionMiddleware, FastJSONResponse
+from common.db import DBRunner
+from database import OrderRequest, get_db_runner, new_db_runner, pool_stats
+from outbox import OutboxDispatcher, RetryLater, add_entry
+from post_commit import PostCommitExecutor
 
-from common.http_client import request_with_cb
+logger = logging.getLogger(__name__)
 
 
 class OrderItem(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(gt=0)
 
 
 class OrderingRequest(BaseModel):
@@ -20,8 +46,17 @@ class OrderingRequest(BaseModel):
     payment_method: str = "COD"
 
 
+class OrderingStatus(BaseModel):
+    id: str
+    status: str            # accepted, processing, compensating, completed, failed
+    step: str              # Last completed step: accepted, stock_reserved, paid, order_created, notified, completed
+    order_id: int | None = None
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
 SERVICE_URLS = {
-    "auth": os.getenv("AUTH_URL", "http://auth-service:8001"),
     "customer": os.getenv("CUSTOMER_URL", "http://customer-service:8003"),
     "product": os.getenv("PRODUCT_URL", "http://product-service:8002"),
     "order": os.getenv("ORDER_URL", "http://order-service:8005"),
@@ -29,7 +64,9 @@ SERVICE_URLS = {
     "cart": os.getenv("CART_URL", "http://cart-service:8004"),
 }
 
-app = FastAPI(title="Make-Order Service")
+app = FastAPI(title="Make-Order Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,59 +82,111 @@ def _raise_http_error(resp, default_status: int = 502):
     raise HTTPException(status_code=resp.status_code or default_status, detail=detail)
 
 
-def _get_customer(customer_id: str):
-    resp = request_with_cb("customer", SERVICE_URLS["customer"], "get", f"/customers/{customer_id}")
+async def _get_customer(customer_id: str):
+    resp = await async_request_with_cb(
+        "customer", SERVICE_URLS["customer"], "get", f"/customers/{customer_id}", idempotent=True
+    )
     if resp.status_code != 200:
         _raise_http_error(resp, 404)
     return resp.json()
 
 
 def _validate_token(auth_header: str) -> str:
-    resp = request_with_cb("auth", SERVICE_URLS["auth"], "get", "/auth/validate", headers={"Authorization": auth_header})
-    if resp.status_code != 200:
-        _raise_http_error(resp, 401)
-    return str(resp.json().get("customer_id"))
+    # Verified locally against the shared JWT secret (no auth-service round trip)
+    claims = verify_bearer(auth_header)
+    customer_id = claims.get("sub")
+    if not customer_id:
+        raise HTTPException(status_code=401, detail="Token missing subject")
+    return str(customer_id)
 
 
-def _get_product(product_id: int):
-    resp = request_with_cb("product", SERVICE_URLS["product"], "get", f"/products/{product_id}")
+async def _get_products(product_ids: List[int]) -> dict:
+    """Fetch every product of the order in one batched call, keyed by id."""
+    resp = await async_request_with_cb(
+        "product",
+        SERVICE_URLS["product"],
+        "get",
+        "/products",
+        params={"ids": ",".join(str(pid) for pid in sorted(set(product_ids)))},
+        idempotent=True,
+    )
     if resp.status_code != 200:
         _raise_http_error(resp, 404)
-    return resp.json()
+    products = {product["id"]: product for product in resp.json()}
+    for product_id in product_ids:
+        if product_id not in products:
+            raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+    return products
 
 
-def _check_stock(product_id: int, quantity: int):
-    resp = request_with_cb(
+async def _check_stock(items: List[OrderItem]):
+    """Validate stock for the whole cart with one bulk stock-check call."""
+    resp = await async_request_with_cb(
         "product",
         SERVICE_URLS["product"],
-        "get",
-        f"/products/{product_id}/stock",
-        params={"quantity": quantity},
+        "post",
+        "/products/stock/check",
+        json={"items": [{"product_id": item.product_id, "quantity": item.quantity} for item in items]},
+        idempotent=True,  # Read-only despite POST
     )
     if resp.status_code != 200:
         _raise_http_error(resp, 404)
     data = resp.json()
-    if not data.get("available"):
-        raise HTTPException(
-            status_code=400,
-            detail=f"Product {product_id} insufficient stock. Available: {data.get('current_stock', 0)}"
-        )
+    if data.get("missing"):
+        raise HTTPException(status_code=404, detail=f"Product {data['missing'][0]} not found")
+    for result in data.get("items", []):
+        if not result.get("available"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Product {result['product_id']} insufficient stock. Available: {result.get('current_stock', 0)}"
+            )
 
 
-def _update_stock(product_id: int, quantity: int):
-    resp = request_with_cb(
+async def _reserve_stock(items: List[OrderItem], reservation_id: str):
+    """
+    Decrement stock for every item atomically (all-or-nothing) in product-service.
+    Keyed by `reservation_id`: repeating the call does not take the stock twice.
+    """
+    resp = await async_request_with_cb(
         "product",
         SERVICE_URLS["product"],
-        "put",
-        f"/products/{product_id}/stock",
-        json={"quantity": quantity},
+        "post",
+        "/products/stock/reserve",
+        json={
+            "items": [{"product_id": item.product_id, "quantity": item.quantity} for item in items],
+            "reservation_id": reservation_id,
+        },
     )
     if resp.status_code != 200:
         _raise_http_error(resp, 400)
     return resp.json()
 
 
-def _create_order(customer_id: str, items: List[OrderItem], note: str | None, payment_method: str, products_info: dict):
+async def _release_stock(reservation_id: str):
+    """
+    Compensation: give back the stock reserved under `reservation_id` for an order that
+    could not be completed. Safe to repeat, and a no-op when nothing was reserved.
+    """
+    resp = await async_request_with_cb(
+        "product",
+        SERVICE_URLS["product"],
+        "post",
+        "/products/stock/release",
+        json={"reservation_id": reservation_id},
+    )
+    if resp.status_code != 200:
+        _raise_http_error(resp, 502)
+    return resp.json()
+
+
+async def _release_stock_quietly(reservation_id: str):
+    try:
+        await _release_stock(reservation_id)
+    except Exception as exc:
+        logger.error(f"[Ordering] Stock for {reservation_id} was not released: {exc}")
+
+
+async def _create_order(customer_id: str, items: List[OrderItem], note: str | None, payment_method: str, products_info: dict, request_id: str):
     # Add price and product_name to items (data duplication for microservices)
     items_with_price = []
     for item in items:
@@ -114,35 +203,77 @@ def _create_order(customer_id: str, items: List[OrderItem], note: str | None, pa
         "items": items_with_price,
         "note": note,
         "payment_method": payment_method,
+        "request_id": request_id,  # A repeated create returns the same order
     }
-    resp = request_with_cb("order", SERVICE_URLS["order"], "post", "/orders", json=payload)
+    resp = await async_request_with_cb("order", SERVICE_URLS["order"], "post", "/orders", json=payload)
     if resp.status_code not in (200, 201):
         _raise_http_error(resp, 400)
     return resp.json()
 
 
-def _send_notification(to_email: str, order_id: int, customer_id: str):
+class OrderStateUnknown(Exception):
+    """Order creation failed and order-service could not say whether the order exists"""
+
+
+async def _find_order(request_id: str) -> dict | None:
+    # Cached or fallback answers could be from before the order was committed: when
+    # order-service can't be asked, the lookup fails instead of reporting "no order"
+    resp = await async_request_with_cb(
+        "order",
+        SERVICE_URLS["order"],
+        "get",
+        "/orders",
+        params={"request_id": request_id},
+        use_cache=False,
+        use_fallback=False,
+        idempotent=True,
+    )
+    if resp.status_code != 200:
+        _raise_http_error(resp, 502)
+    orders = resp.json()
+    return orders[0] if orders else None
+
+
+async def _create_or_recover_order(request_id: str, *args) -> dict:
+    """
+    _create_order(*args) keyed by `request_id`. A timeout or 5xx may come after the order
+    was committed, so order-service is asked before giving up: the existing order is
+    returned, otherwise the original error is raised (OrderStateUnknown if the lookup fails too).
+    """
+    try:
+        return await _create_order(*args, request_id)
+    except HTTPException as exc:
+        if exc.status_code < 500:
+            raise
+        try:
+            order = await _find_order(request_id)
+        except HTTPException as lookup_exc:
+            raise OrderStateUnknown(f"{exc.detail}; order lookup failed: {lookup_exc.detail}")
+        if order is None:
+            raise
+        return order
+
+
+async def _send_notification(to_email: str, order_id: int, customer_id: str):
     """
     Send notification via RabbitMQ event (async)
-    Fallback to HTTP if event publishing fails
+    Fallback to HTTP while RabbitMQ is unreachable or the publish buffer is full
     """
-    from common.event_publisher import publish_event
-    
     try:
-        # Publish event to RabbitMQ (async, non-blocking)
+        # Enqueue event for the background RabbitMQ publisher (in-memory, non-blocking)
         publish_event("order.created", {
             "order_id": order_id,
             "customer_email": to_email,
             "customer_id": customer_id
         })
-    except Exception as e:
-        # Fallback to HTTP if RabbitMQ fails
+    except (PublisherUnavailable, PublisherBackpressure):
+        # Event was not buffered: send the email over HTTP instead
         body = {
             "to": to_email,
             "subject": f"Order #{order_id} confirmation",
             "content": f"Your order #{order_id} has been placed successfully.",
         }
-        resp = request_with_cb("notification", SERVICE_URLS["notification"], "post", "/notifications/email", json=body)
+        resp = await async_request_with_cb("notification", SERVICE_URLS["notification"], "post", "/notifications/email", json=body)
         if resp.status_code != 200:
             _raise_http_error(resp, 502)
 
@@ -155,8 +286,10 @@ def _extract_auth_header(authorization: str | None) -> str:
     return authorization
 
 
-def _clear_cart(customer_id: str):
-    request_with_cb("cart", SERVICE_URLS["cart"], "delete", f"/customers/{customer_id}/cart")
+async def _clear_cart(customer_id: str):
+    resp = await async_request_with_cb("cart", SERVICE_URLS["cart"], "delete", f"/customers/{customer_id}/cart")
+    if resp.status_code != 200:
+        _raise_http_error(resp, 502)
 
 
 def _process_payment(method: str):
@@ -166,37 +299,217 @@ def _process_payment(method: str):
     return True  # COD or others treated as success
 
 
+def _raise_first_error(results):
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+def _wants_async(prefer: str | None) -> bool:
+    """Prefer: respond-async (RFC 7240) selects accept-fast mode"""
+    return bool(prefer) and "respond-async" in [p.strip().lower() for p in prefer.split(",")]
+
+
+def _accept_order(db: Session, request: OrderingRequest, customer: dict, products_info: dict) -> str:
+    """Write the order request and its outbox entry in one local transaction"""
+    tracking_id = str(uuid.uuid4())
+    db.add(OrderRequest(
+        id=tracking_id,
+        customer_id=request.customer_id,
+        payload={
+            "items": [item.model_dump() for item in request.items],
+            "note": request.note,
+            "payment_method": request.payment_method,
+            "customer_email": customer.get("email", ""),
+            "products": list(products_info.values()),  # Names / prices as validated at acceptance
+        },
+        status="accepted",
+        step="accepted",
+    ))
+    add_entry(db, tracking_id)
+    db.commit()
+    return tracking_id
+
+
+def _load_request(db: Session, tracking_id: str) -> dict | None:
+    row = db.get(OrderRequest, tracking_id)
+    if row is None:
+        return None
+    return {column.name: getattr(row, column.name) for column in OrderRequest.__table__.columns}
+
+
+def _save_request(db: Session, tracking_id: str, values: dict):
+    db.execute(
+        update(OrderRequest)
+        .where(OrderRequest.id == tracking_id)
+        .values(updated_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+async def _compensate(runner: DBRunner, request: dict, error: str, final_attempt: bool):
+    # The release is keyed by the tracking id, so it is also safe (a no-op) when the
+    # reserve never committed, and covers a reserve that timed out after committing
+    await runner.run(_save_request, request["id"], {"status": "compensating", "error": error})
+    try:
+        await _release_stock(request["id"])
+    except HTTPException as exc:
+        if exc.status_code >= 500 and not final_attempt:
+            raise RetryLater(f"Stock release failed: {exc.detail}")
+        logger.error(f"[Ordering] Stock for {request['id']} was not released: {exc.detail}")
+        error = f"{error} (stock not released: {exc.detail})"
+    await runner.run(_save_request, request["id"], {"status": "failed", "error": error})
+
+
+async def _run_order_saga(tracking_id: str, final_attempt: bool):
+    """
+    Outbox handler for an accepted order: reserve stock, pay, create the order, notify,
+    clear the cart. Progress is saved after every step, so a retried or re-leased entry
+    resumes where it stopped. Reserve and create are keyed by the tracking id, so
+    repeating them after a timeout does not reserve or order twice. A permanent failure
+    before the order exists releases the reserved stock; after that, the order is kept
+    and later steps are best effort.
+    """
+    runner = new_db_runner()
+    try:
+        request = await runner.run(_load_request, tracking_id)
+        if request is None or request["status"] in ("completed", "failed"):
+            return
+        payload = request["payload"]
+        items = [OrderItem(**item) for item in payload["items"]]
+        customer_id = request["customer_id"]
+
+        if request["status"] == "compensating":
+            await _compensate(runner, request, request["error"], final_attempt)
+            return
+
+        step = request["step"]
+        try:
+            if step == "accepted":
+                await _reserve_stock(items, tracking_id)
+                step = "stock_reserved"
+                await runner.run(_save_request, tracking_id, {"step": step, "status": "processing", "error": None})
+            if step == "stock_reserved":
+                if not _process_payment(payload["payment_method"]):
+                    raise HTTPException(status_code=400, detail="Payment failed")
+                step = "paid"
+                await runner.run(_save_request, tracking_id, {"step": step})
+            if step == "paid":
+                products_info = {product["id"]: product for product in payload["products"]}
+                order = await _create_or_recover_order(
+                    tracking_id, customer_id, items, payload["note"], payload["payment_method"], products_info
+                )
+                request["order_id"] = order.get("id")
+                step = "order_created"
+                await runner.run(_save_request, tracking_id, {"step": step, "order_id": request["order_id"]})
+        except HTTPException as exc:
+            request["step"] = step
+            if exc.status_code >= 500 and not final_attempt:
+                await runner.run(_save_request, tracking_id, {"error": str(exc.detail)})
+                raise RetryLater(str(exc.detail))
+            await _compensate(runner, request, str(exc.detail), final_attempt)
+            return
+        except OrderStateUnknown as exc:
+            if not final_attempt:
+                await runner.run(_save_request, tracking_id, {"error": str(exc)})
+                raise RetryLater(str(exc))
+            # The order may exist: keep the stock rather than release it under a live order
+            logger.error(f"[Ordering] {tracking_id}: {exc}; stock kept reserved")
+            await runner.run(_save_request, tracking_id, {"status": "failed", "error": f"{exc} (stock kept reserved)"})
+            return
+
+        # The order exists from here on: these steps are retried but never undo it
+        try:
+            if step == "order_created":
+                await _send_notification(payload["customer_email"], request["order_id"], customer_id)
+                step = "notified"
+                await runner.run(_save_request, tracking_id, {"step": step})
+            if step == "notified":
+                await _clear_cart(customer_id)
+                step = "completed"
+        except HTTPException as exc:
+            if exc.status_code >= 500 and not final_attempt:
+                raise RetryLater(str(exc.detail))
+            logger.warning(f"[Ordering] {tracking_id}: {step} step skipped: {exc.detail}")
+            await runner.run(_save_request, tracking_id, {"step": "completed", "status": "completed", "error": str(exc.detail)})
+            return
+        await runner.run(_save_request, tracking_id, {"step": "completed", "status": "completed", "error": None})
+    finally:
+        await runner.close()
+
+
+dispatcher = OutboxDispatcher(_run_order_saga)
+post_commit = PostCommitExecutor()
+
+
 @app.post("/ordering")
-def ordering(request: OrderingRequest, authorization: str | None = Header(default=None)):
+async def ordering(
+    request: OrderingRequest,
+    authorization: str | None = Header(default=None),
+    prefer: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
     auth_header = _extract_auth_header(authorization)
 
-    # 1) Validate token
+    # 1) Validate token (local JWT verification)
     validated_customer_id = _validate_token(auth_header)
     if validated_customer_id and validated_customer_id != request.customer_id:
         raise HTTPException(status_code=401, detail="Customer mismatch with token")
 
-    # 2) Fetch customer info
-    customer = _get_customer(request.customer_id)
-
-    # 3) Get product info and check stock for each item
-    products_info = {}
-    for item in request.items:
-        product = _get_product(item.product_id)
-        products_info[item.product_id] = product
-        _check_stock(item.product_id, item.quantity)
-
-    # 4) Update stock
-    for item in request.items:
-        _update_stock(item.product_id, item.quantity)
-
-    # 5) Create order
-    order = _create_order(request.customer_id, request.items, request.note, request.payment_method, products_info)
-
-    # 6) Send notification (async via RabbitMQ)
-    _send_notification(customer.get("email", ""), order.get("id"), request.customer_id)
+    # 2-3) Fetch customer, get product info and check stock.
+    # These reads are independent of each other, so they are fanned out concurrently;
+    # products and stock are each validated for the whole cart in a single call, so
+    # there are always three calls (per-service bulkheads bound the load on each).
+    # Exceptions are returned in place of results so they can be raised in pipeline order.
+    results = await asyncio.gather(
+        _get_customer(request.customer_id),
+        _get_products([item.product_id for item in request.items]),
+        _check_stock(request.items),
+        return_exceptions=True,
+    )
+    # Errors are raised in the same order the sequential pipeline would hit them
+    _raise_first_error(results)
+
+    customer, products_info = results[0], results[1]
+
+    if _wants_async(prefer):
+        # Accept-fast: the remaining steps run in the outbox dispatcher
+        tracking_id = await db.run(_accept_order, request, customer, products_info)
+        dispatcher.wake()
+        return JSONResponse(
+            status_code=202,
+            content={"id": tracking_id, "status": "accepted", "status_url": f"/ordering/{tracking_id}"},
+            headers={"Location": f"/ordering/{tracking_id}", "Preference-Applied": "respond-async"},
+        )
 
-    # 7) Clear cart
-    _clear_cart(request.customer_id)
+    # 4) Reserve stock for the whole order in one transaction; the key also makes the
+    # order create idempotent and lets a failed order give back exactly this reservation
+    reservation_id = str(uuid.uuid4())
+    try:
+        await _reserve_stock(request.items, reservation_id)
+    except HTTPException as exc:
+        if exc.status_code >= 500:
+            # The reservation may have been committed before the error
+            await _release_stock_quietly(reservation_id)
+        raise
+
+    # 5) Create order; the stock goes back if the order was not created
+    try:
+        order = await _create_or_recover_order(
+            reservation_id, request.customer_id, request.items, request.note, request.payment_method, products_info
+        )
+    except OrderStateUnknown as exc:
+        logger.error(f"[Ordering] {reservation_id}: {exc}; stock kept reserved")
+        raise HTTPException(status_code=502, detail=str(exc))
+    except Exception:
+        await _release_stock_quietly(reservation_id)
+        raise
+
+    # 6-7) Send notification and clear cart after the response: the order is already
+    # created, and neither step changes what the client gets back
+    await post_commit.submit("notification", _send_notification, customer.get("email", ""), order.get("id"), request.customer_id)
+    await post_commit.submit("clear_cart", _clear_cart, request.customer_id)
 
     # 8) Process payment (stub)
     if not _process_payment(request.payment_method):
@@ -205,6 +518,57 @@ def ordering(request: OrderingRequest, authorization: str | None = Header(defaul
     return {"status": "success", "order": order}
 
 
+@app.get("/ordering/{tracking_id}", response_model=OrderingStatus)
+async def ordering_status(
+    tracking_id: str,
+    authorization: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    """Progress of an order accepted with Prefer: respond-async"""
+    claims = verify_bearer(_extract_auth_header(authorization))
+    request = await db.run(_load_request, tracking_id)
+    # Other customers' requests are reported as missing
+    if request is None or (claims.get("role") != "admin" and str(claims.get("sub")) != request["customer_id"]):
+        raise HTTPException(status_code=404, detail="Ordering request not found")
+    return request
+
+
+@app.on_event("startup")
+async def startup_event():
+    dispatcher.start()
+    post_commit.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Stop the outbox dispatcher, finish queued post-commit side effects, flush pending
+    events and close pooled downstream connections
+    """
+    await dispatcher.stop()
+    await post_commit.stop()
+    await asyncio.to_thread(get_publisher().close)
+    await aclose_clients()
+    close_sessions()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "circuit_breakers": get_breaker_stats(),
+        "http_pools": get_pool_stats(),
+        "response_cache": get_cache_stats(),
+        "coalescing": get_coalescing_stats(),
+        "bulkheads": get_bulkhead_stats(),
+        "retries": get_retry_stats(),
+        "event_publisher": get_publisher().stats(),
+        "auth_cache": get_auth_cache_stats(),
+        "outbox": dispatcher.stats(),
+        "post_commit": post_commit.stats(),
+        "db_pool": pool_stats(),
+    }
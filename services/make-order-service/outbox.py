@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from database import OutboxEntry, new_db_runner
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))              # Idle poll interval (new entries wake the dispatcher)
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))                 # Entries processed at once per process
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))          # A claimed entry is hidden from other dispatchers this long
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))                # The last attempt is told it is final
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "1"))  # Backoff: base * 2^(attempt - 1)
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "60"))
+
+
+class RetryLater(Exception):
+    """Raised by an outbox handler for a transient failure: the entry is retried with backoff"""
+
+
+def add_entry(db: Session, request_id: str):
+    """Queue work for `request_id`; call inside the transaction that writes the request"""
+    db.add(OutboxEntry(request_id=request_id))
+
+
+def _claim(db: Session, limit: int, lease: float) -> List[Tuple[int, str, int]]:
+    """Lease up to `limit` due entries: [(entry id, request id, attempt number)]"""
+    now = datetime.utcnow()
+    due = (
+        select(OutboxEntry.id)
+        .where(
+            OutboxEntry.processed_at.is_(None),
+            OutboxEntry.available_at <= now,
+            or_(OutboxEntry.locked_until.is_(None), OutboxEntry.locked_until < now),
+        )
+        .order_by(OutboxEntry.id)
+        .limit(limit)
+        # Postgres: concurrent dispatchers (other replicas) skip rows being claimed instead of waiting
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(OutboxEntry)
+        .where(OutboxEntry.id.in_(due))
+        .values(locked_until=now + timedelta(seconds=lease), attempts=OutboxEntry.attempts + 1)
+        .returning(OutboxEntry.id, OutboxEntry.request_id, OutboxEntry.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [tuple(row) for row in rows]
+
+
+def _finish(db: Session, entry_id: int, error: str | None = None):
+    db.execute(
+        update(OutboxEntry)
+        .where(OutboxEntry.id == entry_id)
+        .values(processed_at=datetime.utcnow(), locked_until=None, last_error=error)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def _reschedule(db: Session, entry_id: int, delay: float, error: str):
+    db.execute(
+        update(OutboxEntry)
+        .where(OutboxEntry.id == entry_id)
+        .values(available_at=datetime.utcnow() + timedelta(seconds=delay), locked_until=None, last_error=error)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def _backoff(attempt: int) -> float:
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempt - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+class OutboxDispatcher:
+    """
+    Background asyncio task draining the ordering outbox.
+
+    Entries are leased (FOR UPDATE SKIP LOCKED on Postgres), so several make-order
+    replicas can dispatch at once, and an entry whose process died is picked up again
+    once its lease expires. Delivery is at-least-once: the handler must resume from the
+    progress it has already recorded.
+
+    handler(request_id, final_attempt) returns when the entry is done, or raises
+    RetryLater (any other exception is retried the same way and logged).
+    """
+
+    def __init__(self, handler: Callable[[str, bool], Awaitable[None]], concurrency: int = OUTBOX_CONCURRENCY):
+        self._handler = handler
+        self._concurrency = max(1, concurrency)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        self._in_flight: set = set()
+        self._stats = {"claimed": 0, "completed": 0, "retried": 0, "gave_up": 0, "errors": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """New entry committed: poll now instead of after OUTBOX_POLL_SECONDS"""
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop claiming and wait up to `timeout` seconds for running entries (the rest resume after their lease)"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=timeout)
+
+    def stats(self) -> dict:
+        return {**self._stats, "in_flight": len(self._in_flight), "concurrency": self._concurrency}
+
+    async def _run(self):
+        while not self._stopping:
+            free = self._concurrency - len(self._in_flight)
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = await self._db(_claim, free, OUTBOX_LEASE_SECONDS)
+                except Exception:
+                    logger.exception("[Outbox] Claim failed")
+            for entry in claimed:
+                task = asyncio.create_task(self._process(*entry))
+                self._in_flight.add(task)
+                task.add_done_callback(self._on_done)
+            self._stats["claimed"] += len(claimed)
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def _on_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # Recording the outcome failed (database down): the entry runs again after its lease
+            logger.error(f"[Outbox] Could not record entry outcome: {task.exception()}")
+        # A slot is free again
+        self._wakeup.set()
+
+    async def _process(self, entry_id: int, request_id: str, attempt: int):
+        final = attempt >= OUTBOX_MAX_ATTEMPTS
+        try:
+            await self._handler(request_id, final)
+        except Exception as exc:
+            if not isinstance(exc, RetryLater):
+                self._stats["errors"] += 1
+                logger.exception(f"[Outbox] Handler failed for {request_id}")
+            if final:
+                self._stats["gave_up"] += 1
+                logger.error(f"[Outbox] Giving up on {request_id} after {attempt} attempts: {exc}")
+                await self._db(_finish, entry_id, str(exc))
+            else:
+                self._stats["retried"] += 1
+                await self._db(_reschedule, entry_id, _backoff(attempt), str(exc))
+            return
+        self._stats["completed"] += 1
+        await self._db(_finish, entry_id)
+
+    async def _db(self, fn, *args):
+        runner = new_db_runner()
+        try:
+            return await runner.run(fn, *args)
+        finally:
+            await runner.close()
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+POST_COMMIT_WORKERS = int(os.getenv("POST_COMMIT_WORKERS", "4"))                     # Side effects run at once per process
+POST_COMMIT_QUEUE_SIZE = int(os.getenv("POST_COMMIT_QUEUE_SIZE", "1000"))            # Queued side effects before callers run them inline
+POST_COMMIT_MAX_ATTEMPTS = int(os.getenv("POST_COMMIT_MAX_ATTEMPTS", "5"))
+POST_COMMIT_RETRY_BASE_SECONDS = float(os.getenv("POST_COMMIT_RETRY_BASE_SECONDS", "0.5"))  # Backoff: base * 2^(attempt - 1)
+POST_COMMIT_RETRY_MAX_SECONDS = float(os.getenv("POST_COMMIT_RETRY_MAX_SECONDS", "10"))
+POST_COMMIT_DRAIN_SECONDS = float(os.getenv("POST_COMMIT_DRAIN_SECONDS", "10"))      # Max wait for queued work on shutdown
+
+
+def _retryable(exc: Exception) -> bool:
+    # 4xx from a downstream service will not succeed on a retry
+    return not isinstance(exc, HTTPException) or exc.status_code >= 500
+
+
+class PostCommitExecutor:
+    """
+    Runs side effects of a committed order (notification, cart clearing) after the
+    response is sent.
+
+    Work goes to a bounded in-memory queue drained by a few asyncio workers. Transient
+    failures (5xx, connection errors) are re-queued with exponential backoff without
+    holding a worker. When the queue is full, submit() runs the step inline instead of
+    dropping it, so a backlog slows checkout down rather than losing work. Queued work
+    is lost if the process dies; these steps are best effort either way.
+    """
+
+    def __init__(
+        self,
+        workers: int = POST_COMMIT_WORKERS,
+        queue_size: int = POST_COMMIT_QUEUE_SIZE,
+        max_attempts: int = POST_COMMIT_MAX_ATTEMPTS,
+    ):
+        self._workers = max(1, workers)
+        self._queue_size = max(1, queue_size)
+        self._max_attempts = max(1, max_attempts)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list = []
+        self._timers: set = set()
+        self._outstanding = 0  # Queued + running + waiting for a retry
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = False
+        self._stats = {"submitted": 0, "inline": 0, "completed": 0, "retried": 0, "failed": 0, "dropped": 0}
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def submit(self, name: str, fn: Callable[..., Awaitable], *args):
+        """Queue `await fn(*args)`; runs it inline (one attempt) if the queue is full or stopping"""
+        self.start()
+        if not self._stopping:
+            try:
+                self._queue.put_nowait((name, fn, args, 1))
+            except asyncio.QueueFull:
+                pass
+            else:
+                self._outstanding += 1
+                self._idle.clear()
+                self._stats["submitted"] += 1
+                return
+        self._stats["inline"] += 1
+        try:
+            await fn(*args)
+        except Exception as exc:
+            self._stats["failed"] += 1
+            logger.error(f"[PostCommit] {name} failed: {exc}")
+        else:
+            self._stats["completed"] += 1
+
+    async def stop(self, timeout: float = POST_COMMIT_DRAIN_SECONDS):
+        """Stop accepting work and wait up to `timeout` seconds for queued work and pending retries"""
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._stats["dropped"] += self._outstanding
+            logger.error(f"[PostCommit] Stopped with {self._outstanding} side effects not done")
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self._queue_size,
+            "outstanding": self._outstanding,
+            "workers": self._workers,
+        }
+
+    async def _worker(self):
+        while True:
+            name, fn, args, attempt = await self._queue.get()
+            try:
+                await fn(*args)
+            except Exception as exc:
+                if _retryable(exc) and attempt < self._max_attempts:
+                    self._stats["retried"] += 1
+                    delay = min(POST_COMMIT_RETRY_BASE_SECONDS * 2 ** (attempt - 1), POST_COMMIT_RETRY_MAX_SECONDS)
+                    self._schedule_retry(delay, (name, fn, args, attempt + 1))
+                    continue
+                self._stats["failed"] += 1
+                logger.error(f"[PostCommit] {name} failed after {attempt} attempts: {exc}")
+            else:
+                self._stats["completed"] += 1
+            self._done()
+
+    def _schedule_retry(self, delay: float, job: tuple):
+        def requeue():
+            self._timers.discard(timer)
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                self._stats["failed"] += 1
+                logger.error(f"[PostCommit] {job[0]} dropped: queue full on retry")
+                self._done()
+
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._timers.add(timer)
+
+    def _done(self):
+        self._outstanding -= 1
+        if self._outstanding == 0:
+            self._idle.set()
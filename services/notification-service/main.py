@@ -2,7 +2,8 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from event_consumer import start_consumer
+from common.serialization import CompressionMiddleware, FastJSONResponse
+from event_consumer import consumer_stats, start_consumer, stop_consumer
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +16,9 @@ class EmailNotification(BaseModel):
     content: str
 
 
-app = FastAPI(title="Notification Service")
+app = FastAPI(title="Notification Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +37,12 @@ async def startup_event():
     logger.info("RabbitMQ consumer started")
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """Stop RabbitMQ consumer workers gracefully"""
+    stop_consumer()
+
+
 @app.post("/notifications/email")
 def send_email(notification: EmailNotification):
     """HTTP endpoint for sending email (legacy/fallback)"""
@@ -44,3 +53,8 @@ def send_email(notification: EmailNotification):
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    return {"consumer": consumer_stats()}
@@ -1,18 +1,32 @@
+import logging
 import os
-from typing import List
+from datetime import date, datetime
+from typing import Dict, List, Literal
 from decimal import Decimal
 
-from fastapi import FastAPI, Header, HTTPException, Depends
+from fastapi import FastAPI, Header, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from jose import jwt, JWTError
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db, Order as DBOrder, OrderItem as DBOrderItem
+from pydantic import BaseModel, Field
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from common.auth import require_admin
+from common.etag import body_etag, conditional_json, etag_matches, make_etag, not_modified
+from common.http_client import aclose_clients, async_request_with_cb, get_breaker_stats, get_bulkhead_stats, get_cache_stats, get_coalescing_stats, get_retry_stats
+from common.serialization import CompressionMiddleware, FastJSONResponse, dump_trusted, dumps, trusted_response
+from common.db import DBRunner
+from database import get_db, get_db_runner, pool_stats, Order as DBOrder, OrderItem as DBOrderItem
+from order_stats import load_stats, record_orders_created, record_status_change
 
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "devsecret")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ORDER_PAGE_MAX = int(os.getenv("ORDER_PAGE_MAX", "200"))   # Max rows per GET /orders page
+ORDER_BULK_MAX = int(os.getenv("ORDER_BULK_MAX", "1000"))  # Max orders per POST /orders/bulk
+CUSTOMER_URL = os.getenv("CUSTOMER_URL", "http://customer-service:8003")
 
-app = FastAPI(title="Order Service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Order Service", default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +34,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
@@ -49,6 +64,12 @@ class OrderCreate(BaseModel):
     items: List[OrderItem]
     note: str | None = None
     payment_method: str = "COD"
+    # Idempotency key: a repeated create with the same request_id returns the existing order
+    request_id: str | None = Field(default=None, min_length=1, max_length=64)
+
+
+class OrderBulkCreate(BaseModel):
+    orders: List[OrderCreate]
 
 
 class Order(BaseModel):
@@ -64,65 +85,267 @@ class Order(BaseModel):
         from_attributes = True
 
 
+class CustomerSummary(BaseModel):
+    id: str
+    name: str
+    email: str
+    phone: str | None = None
+    address: str | None = None
+
+
+class OrderWithCustomer(Order):
+    customer: CustomerSummary | None = None  # None if the customer is unknown or customer-service is down
+
+
+class RecentOrder(OrderWithCustomer):
+    created_at: datetime | None = None
+
+
+class DailyRevenue(BaseModel):
+    day: date
+    orders: int
+    revenue: float
+
+
+class ProductSalesSummary(BaseModel):
+    product_id: int
+    product_name: str | None = None
+    quantity: int
+    revenue: float
+
+
+class OrderStats(BaseModel):
+    total_orders: int
+    total_revenue: float                 # Excludes cancelled orders
+    status_counts: Dict[str, int]
+    revenue_by_day: List[DailyRevenue]
+    top_products: List[ProductSalesSummary]
+    recent_orders: List[RecentOrder]
+
+
 class OrderStatusUpdate(BaseModel):
     status: str
 
 
-def _require_admin(auth_header: str | None):
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing/invalid Authorization")
-    token = auth_header.split(" ", 1)[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin role required")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+def _insert_orders(db: Session, payloads: List[OrderCreate]) -> List[dict]:
+    """
+    Insert orders with one multi-row INSERT ... RETURNING id, then all their items the same
+    way, and return the orders as dicts built from the request (nothing is read back)
+    """
+    now = datetime.utcnow()
+    orders = []
+    for payload in payloads:
+        total = sum(item.price * item.quantity for item in payload.items if item.price)
+        orders.append({
+            "customer_id": payload.customer_id,
+            "request_id": payload.request_id,
+            "note": payload.note,
+            "payment_method": payload.payment_method,
+            "status": "pending",
+            "total_amount": Decimal(str(total)) if total > 0 else None,
+            "created_at": now,
+            "updated_at": now,
+        })
+    # sort_by_parameter_order: returned ids line up with the rows sent
+    order_ids = db.execute(insert(DBOrder).returning(DBOrder.id, sort_by_parameter_order=True), orders).scalars().all()
+
+    items = []
+    for order, order_id, payload in zip(orders, order_ids, payloads):
+        order["id"] = order_id
+        order["items"] = [
+            {
+                "order_id": order_id,
+                "product_id": item.product_id,
+                "product_name": item.product_name,  # Store product name (data duplication)
+                "quantity": item.quantity,
+                "price": Decimal(str(item.price)) if item.price else Decimal("0"),
+            }
+            for item in payload.items
+        ]
+        items.extend(order["items"])
+    if items:
+        item_ids = db.execute(
+            insert(DBOrderItem).returning(DBOrderItem.id, sort_by_parameter_order=True), items
+        ).scalars().all()
+        for item, item_id in zip(items, item_ids):
+            item["id"] = item_id
+
+    # Dashboard aggregates are updated in the same transaction
+    record_orders_created(db, orders)
+    return orders
+
+
+def _order_by_request_id(db: Session, request_id: str):
+    return db.query(DBOrder).options(selectinload(DBOrder.items)).filter(DBOrder.request_id == request_id).first()
 
 
 @app.post("/orders", response_model=Order, status_code=201)
 def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
-    # Calculate total amount
-    total = sum(item.price * item.quantity for item in payload.items if item.price)
-    
-    order = DBOrder(
-        customer_id=payload.customer_id,
-        note=payload.note,
-        payment_method=payload.payment_method,
-        status="pending",
-        total_amount=Decimal(str(total)) if total > 0 else None
-    )
-    db.add(order)
-    db.flush()
-    
-    # Add order items
-    for item in payload.items:
-        order_item = DBOrderItem(
-            order_id=order.id,
-            product_id=item.product_id,
-            product_name=item.product_name,  # Store product name (data duplication)
-            quantity=item.quantity,
-            price=Decimal(str(item.price)) if item.price else Decimal("0")
+    """
+    With a request_id, retrying the call returns the order already created for it (200)
+    instead of inserting a duplicate; the unique column settles concurrent retries.
+    """
+    if payload.request_id is not None:
+        existing = _order_by_request_id(db, payload.request_id)
+        if existing is not None:
+            return trusted_response(existing, Order)
+    try:
+        order = _insert_orders(db, [payload])[0]
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = _order_by_request_id(db, payload.request_id) if payload.request_id is not None else None
+        if existing is None:
+            raise
+        return trusted_response(existing, Order)
+    return trusted_response(order, Order, status_code=201)
+
+
+@app.post("/orders/bulk", response_model=List[Order], status_code=201)
+def create_orders_bulk(
+    payload: OrderBulkCreate,
+    db: Session = Depends(get_db),
+    authorization: str | None = Header(default=None),
+):
+    """Import / replay many orders in one transaction (all or nothing)"""
+    require_admin(authorization)
+    if len(payload.orders) > ORDER_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {ORDER_BULK_MAX} orders per request")
+    if not payload.orders:
+        return []
+    try:
+        orders = _insert_orders(db, payload.orders)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="request_id already used by another order")
+    return trusted_response(orders, Order, status_code=201)
+
+
+async def _get_customers(customer_ids: List[str]) -> dict:
+    """Customer summaries for a page of orders with one batched customer-service call, keyed by id"""
+    if not customer_ids:
+        return {}
+    try:
+        resp = await async_request_with_cb(
+            "customer",
+            CUSTOMER_URL,
+            "get",
+            "/customers",
+            params={"ids": ",".join(sorted(set(customer_ids)))},
+            idempotent=True,
         )
-        db.add(order_item)
-    
-    db.commit()
-    db.refresh(order)
-    return order
+    except HTTPException as exc:
+        # Embedded summaries are optional: the page is still served without them
+        logger.warning(f"Customer lookup failed: {exc.detail}")
+        return {}
+    if resp.status_code != 200:
+        logger.warning(f"Customer lookup failed with status {resp.status_code}")
+        return {}
+    return {customer["id"]: customer for customer in resp.json()}
 
 
-@app.get("/orders", response_model=List[Order])
-def list_orders(db: Session = Depends(get_db)):
-    orders = db.query(DBOrder).all()
-    return orders
+@app.get(
+    "/orders",
+    response_model=List[Order],
+    responses={200: {"description": "With expand=customer each order has a customer summary", "model": List[OrderWithCustomer]}},
+)
+async def list_orders(
+    customer_id: str | None = None,
+    status: str | None = None,
+    request_id: str | None = Query(default=None, description="The order created with this request_id, if any"),
+    since: datetime | None = Query(default=None, description="Only orders created at or after this time"),
+    cursor: int | None = Query(default=None, description="Return orders with id lower than this (keyset pagination)"),
+    limit: int | None = Query(default=None, ge=1, le=ORDER_PAGE_MAX),
+    expand: Literal["customer"] | None = Query(default=None, description="customer: embed customer summaries"),
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    def page_query(session: Session):
+        query = session.query(DBOrder)
+        if customer_id is not None:
+            query = query.filter(DBOrder.customer_id == customer_id)
+        if status is not None:
+            query = query.filter(DBOrder.status == status)
+        if request_id is not None:
+            query = query.filter(DBOrder.request_id == request_id)
+        if since is not None:
+            query = query.filter(DBOrder.created_at >= since)
+        if cursor is not None:
+            query = query.filter(DBOrder.id < cursor)
+        query = query.order_by(DBOrder.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    # Newest first; items are loaded with one extra IN query instead of one query per order
+    orders = await db.run(lambda session: page_query(session).options(selectinload(DBOrder.items)).all())
+    headers = {}
+    if limit is not None and len(orders) == limit:
+        headers["X-Next-Cursor"] = str(orders[-1].id)
+    if expand is None:
+        # Validator from the loaded page's (id, updated_at): a 304 skips serialization, not a query
+        etag = make_etag(*[(order.id, order.updated_at) for order in orders])
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return trusted_response(orders, Order, headers={**headers, "ETag": etag})
+
+    # One customer fetch for the whole page; customer data lives in customer-service,
+    # so the ETag is taken from the rendered body
+    customers = await _get_customers([order.customer_id for order in orders])
+    content = [dump_trusted(order, Order) for order in orders]
+    for item in content:
+        item["customer"] = customers.get(item["customer_id"])
+    body = dumps(content)
+    return conditional_json(body, body_etag(body), if_none_match, headers=headers)
+
+
+def _recent_orders(db: Session, limit: int):
+    return db.query(DBOrder).options(selectinload(DBOrder.items)).order_by(DBOrder.id.desc()).limit(limit).all()
+
+
+@app.get("/orders/stats", response_model=OrderStats)
+async def order_stats(
+    days: int = Query(default=30, ge=1, le=366, description="Days of revenue_by_day, ending today (UTC)"),
+    top: int = Query(default=5, ge=1, le=50, description="Number of top products by quantity"),
+    recent: int = Query(default=5, ge=0, le=50, description="Number of most recent orders"),
+    authorization: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    require_admin(authorization)
+    # Read from the summary tables (see order_stats.py), not from the order history
+    stats = await db.run(load_stats, days, top)
+    orders = await db.run(_recent_orders, recent) if recent else []
+    customers = await _get_customers([order.customer_id for order in orders])
+    stats["recent_orders"] = [
+        {**dump_trusted(order, RecentOrder), "customer": customers.get(order.customer_id)} for order in orders
+    ]
+    return stats
+
+
+def _order_version(db: Session, order_id: int):
+    return db.query(DBOrder.updated_at).filter(DBOrder.id == order_id).first()
+
+
+def _load_order(db: Session, order_id: int):
+    return db.query(DBOrder).options(selectinload(DBOrder.items)).filter(DBOrder.id == order_id).first()
 
 
 @app.get("/orders/{order_id}", response_model=Order)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(DBOrder).filter(DBOrder.id == order_id).first()
-    if not order:
+async def get_order(
+    order_id: int,
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    version = await db.run(_order_version, order_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    etag = make_etag(order_id, version.updated_at)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    order = await db.run(_load_order, order_id)
+    return trusted_response(order, Order, headers={"ETag": etag})
 
 
 @app.put("/orders/{order_id}/status", response_model=Order)
@@ -132,15 +355,37 @@ def update_status(
     db: Session = Depends(get_db),
     authorization: str | None = Header(default=None)
 ):
-    _require_admin(authorization)
-    order = db.query(DBOrder).filter(DBOrder.id == order_id).first()
+    require_admin(authorization)
+    # Row lock: a concurrent status change waits and then sees this one's status, so each
+    # transition moves the summary counters from the status it actually replaced
+    order = db.query(DBOrder).filter(DBOrder.id == order_id).with_for_update().first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    old_status = order.status
     order.status = payload.status
+    record_status_change(db, order, old_status)
     db.commit()
     db.refresh(order)
-    return order
+    return trusted_response(order, Order)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled customer-service connections"""
+    await aclose_clients()
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "db_pool": pool_stats(),
+        "circuit_breakers": get_breaker_stats(),
+        "response_cache": get_cache_stats(),
+        "coalescing": get_coalescing_stats(),
+        "bulkheads": get_bulkhead_stats(),
+        "retries": get_retry_stats(),
+    }
 
 
 @app.get("/health")
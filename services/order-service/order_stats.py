@@ -0,0 +1,180 @@
+"""
+Dashboard aggregates for GET /orders/stats.
+
+The summary tables (order_status_counts, order_daily_revenue, product_sales) are kept up
+to date by create_order and update_status inside their own transactions, so reading the
+stats costs a few small queries regardless of how many orders exist.
+
+Backfill / repair from orders and order_items:
+
+    python order_stats.py rebuild
+"""
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, List
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from common.db import dialect_insert
+from database import SessionLocal, Order, OrderItem, OrderStatusCount, OrderDailyRevenue, ProductSales
+
+# Orders in these statuses are left out of revenue and product sales (still counted by status)
+UNCOUNTED_STATUSES = frozenset({"cancelled"})
+
+
+def _counts_toward_sales(status: str) -> bool:
+    return status not in UNCOUNTED_STATUSES
+
+
+def _increment(db: Session, model, key: str, rows: List[dict], replace: Iterable[str] = ()):
+    """
+    INSERT ... ON CONFLICT (key) DO UPDATE SET col = col + excluded.col for the other columns
+    (columns in `replace` take the new value unless it is NULL). Rows are sorted by key so
+    concurrent transactions lock summary rows in the same order.
+    """
+    if not rows:
+        return
+    rows = sorted(rows, key=lambda row: row[key])
+    stmt = dialect_insert(db)(model).values(rows)
+    set_ = {
+        name: func.coalesce(stmt.excluded[name], getattr(model, name)) if name in replace
+        else getattr(model, name) + stmt.excluded[name]
+        for name in rows[0]
+        if name != key
+    }
+    db.execute(stmt.on_conflict_do_update(index_elements=[key], set_=set_))
+
+
+def _order_values(order: Order) -> dict:
+    return {
+        "created_at": order.created_at,
+        "total_amount": order.total_amount,
+        "items": [
+            {"product_id": item.product_id, "product_name": item.product_name, "quantity": item.quantity, "price": item.price}
+            for item in order.items
+        ],
+    }
+
+
+def _apply_sales(db: Session, orders: Iterable[dict], sign: int):
+    """Add (sign=1) or remove (sign=-1) the orders' revenue and product quantities"""
+    days, products = {}, {}
+    for order in orders:
+        day = (order["created_at"] or datetime.utcnow()).date()
+        daily = days.setdefault(day, {"day": day, "order_count": 0, "revenue": Decimal("0")})
+        daily["order_count"] += sign
+        daily["revenue"] += sign * (order["total_amount"] or Decimal("0"))
+        for item in order["items"]:
+            row = products.setdefault(
+                item["product_id"],
+                {"product_id": item["product_id"], "product_name": item["product_name"], "quantity": 0, "revenue": Decimal("0")},
+            )
+            row["quantity"] += sign * item["quantity"]
+            row["revenue"] += sign * item["price"] * item["quantity"]
+    _increment(db, OrderDailyRevenue, "day", list(days.values()))
+    _increment(db, ProductSales, "product_id", list(products.values()), replace=("product_name",))
+
+
+def record_orders_created(db: Session, orders: List[dict]):
+    """
+    Call with the inserted orders (status, created_at, total_amount and items with
+    product_id, product_name, quantity, price) before commit.
+    One upsert per summary table, however many orders and lines.
+    """
+    counts = Counter(order["status"] for order in orders)
+    _increment(db, OrderStatusCount, "status", [{"status": status, "order_count": n} for status, n in counts.items()])
+    _apply_sales(db, [order for order in orders if _counts_toward_sales(order["status"])], 1)
+
+
+def record_status_change(db: Session, order: Order, old_status: str):
+    """Call after order.status is changed, before commit"""
+    if old_status == order.status:
+        return
+    _increment(db, OrderStatusCount, "status", [
+        {"status": old_status, "order_count": -1},
+        {"status": order.status, "order_count": 1},
+    ])
+    was_counted, is_counted = _counts_toward_sales(old_status), _counts_toward_sales(order.status)
+    if was_counted != is_counted:
+        _apply_sales(db, [_order_values(order)], 1 if is_counted else -1)
+
+
+def load_stats(db: Session, days: int, top: int) -> dict:
+    status_counts = {
+        status: count
+        for status, count in db.execute(select(OrderStatusCount.status, OrderStatusCount.order_count))
+        if count
+    }
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    revenue_by_day = [
+        {"day": day, "orders": count, "revenue": revenue}
+        for day, count, revenue in db.execute(
+            select(OrderDailyRevenue.day, OrderDailyRevenue.order_count, OrderDailyRevenue.revenue)
+            .where(OrderDailyRevenue.day >= since)
+            .order_by(OrderDailyRevenue.day)
+        )
+    ]
+    top_products = [
+        dict(row._mapping)
+        for row in db.execute(
+            select(ProductSales.product_id, ProductSales.product_name, ProductSales.quantity, ProductSales.revenue)
+            .where(ProductSales.quantity > 0)
+            .order_by(ProductSales.quantity.desc(), ProductSales.product_id)
+            .limit(top)
+        )
+    ]
+    total_revenue = db.execute(select(func.coalesce(func.sum(OrderDailyRevenue.revenue), 0))).scalar()
+    return {
+        "total_orders": sum(status_counts.values()),
+        "total_revenue": total_revenue,
+        "status_counts": status_counts,
+        "revenue_by_day": revenue_by_day,
+        "top_products": top_products,
+    }
+
+
+def rebuild(db: Session):
+    """Recompute every summary table from orders / order_items (one transaction)"""
+    if db.get_bind().dialect.name == "postgresql":
+        # Order writes wait until the summaries are recomputed, so none is lost or counted twice
+        db.execute(text("LOCK TABLE orders, order_items IN SHARE MODE"))
+    for model in (OrderStatusCount, OrderDailyRevenue, ProductSales):
+        db.execute(delete(model))
+
+    counted = Order.status.not_in(UNCOUNTED_STATUSES)
+    day = func.date(Order.created_at)
+    db.execute(insert(OrderStatusCount).from_select(
+        ["status", "order_count"],
+        select(Order.status, func.count()).group_by(Order.status),
+    ))
+    db.execute(insert(OrderDailyRevenue).from_select(
+        ["day", "order_count", "revenue"],
+        select(day, func.count(), func.coalesce(func.sum(Order.total_amount), 0)).where(counted).group_by(day),
+    ))
+    db.execute(insert(ProductSales).from_select(
+        ["product_id", "product_name", "quantity", "revenue"],
+        select(
+            OrderItem.product_id,
+            func.max(OrderItem.product_name),
+            func.sum(OrderItem.quantity),
+            func.sum(OrderItem.price * OrderItem.quantity),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(counted)
+        .group_by(OrderItem.product_id),
+    ))
+    db.commit()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python order_stats.py rebuild")
+    session = SessionLocal()
+    try:
+        rebuild(session)
+        print(load_stats(session, days=30, top=5))
+    finally:
+        session.close()
@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from common.lru import LRUCache
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))          # Max product rows cached
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))              # Row / page TTL (seconds)
+CATALOG_PAGE_CACHE_SIZE = int(os.getenv("CATALOG_PAGE_CACHE_SIZE", "256"))   # Max encoded list pages cached
+STOCK_CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", "2"))                   # Max age of cached stock reads, 0 = always DB
+
+
+class CatalogCache:
+    """
+    In-process read-through cache for product-service.
+
+    - rows: serialized products keyed by id, invalidated per id on writes
+    - pages: pre-encoded response bodies (GET /products pages and single products)
+      with their headers, dropped on any catalog write
+    Stock writes are written through to the cached row (read-your-writes within
+    this process); stock reads additionally cap the row age at STOCK_CACHE_TTL.
+
+    Reads take a read_token() before querying and pass it to put_product / put_page:
+    if the product (or any list) was written after that, the result may predate the
+    write and is not cached.
+    """
+
+    def __init__(self):
+        self.rows = LRUCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+        self.pages = LRUCache(CATALOG_PAGE_CACHE_SIZE, CATALOG_CACHE_TTL)
+        self._lock = threading.Lock()
+        self._writes = 0                       # Bumped by every write
+        self._written_at: Dict[int, int] = {}  # Product id -> _writes at its last write
+        self._lists_written_at = 0
+        self._stale_puts = 0
+
+    def read_token(self) -> int:
+        with self._lock:
+            return self._writes
+
+    def get_product(self, product_id: int, max_age: Optional[float] = None) -> Optional[dict]:
+        return self.rows.get(product_id, max_age)
+
+    def get_products(self, product_ids: Iterable[int], max_age: Optional[float] = None) -> Tuple[List[dict], List[int]]:
+        """Returns (cached products, ids that must be loaded from the database)"""
+        found, missing = [], []
+        for product_id in product_ids:
+            product = self.rows.get(product_id, max_age)
+            if product is None:
+                missing.append(product_id)
+            else:
+                found.append(product)
+        return found, missing
+
+    def put_product(self, product: dict, read_token: int):
+        """Cache a row read from the database, unless it was written after `read_token`"""
+        with self._lock:
+            if self._written_at.get(product["id"], -1) > read_token:
+                self._stale_puts += 1
+                return
+            self.rows.set(product["id"], product)
+
+    def write_product(self, product: dict):
+        """Write-through of a row just committed by this process"""
+        with self._lock:
+            self._mark_written(product["id"])
+            self.rows.set(product["id"], product)
+
+    def set_inventory(self, product_id: int, inventory: int):
+        """Write-through after a committed stock change"""
+        with self._lock:
+            self._mark_written(product_id)
+            product = self.rows.get(product_id)
+            if product is not None:
+                self.rows.set(product_id, dict(product, inventory=inventory))
+
+    def invalidate_product(self, product_id: int):
+        with self._lock:
+            self._mark_written(product_id)
+            self.rows.delete(product_id)
+        self.invalidate_lists()
+
+    def invalidate_lists(self):
+        with self._lock:
+            self._writes += 1
+            self._lists_written_at = self._writes
+            self.pages.clear()
+
+    def get_page(self, key: Hashable) -> Optional[Tuple[bytes, dict]]:
+        return self.pages.get(key)
+
+    def put_page(self, key: Hashable, body: bytes, headers: dict, read_token: int):
+        with self._lock:
+            if self._lists_written_at > read_token:
+                self._stale_puts += 1
+                return
+            self.pages.set(key, (body, headers))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stale_puts = self._stale_puts
+        return {"rows": self.rows.stats(), "pages": self.pages.stats(), "stale_puts_skipped": stale_puts}
+
+    def _mark_written(self, product_id: int):
+        # One entry per written product id, so bounded by the catalog size
+        self._writes += 1
+        self._written_at[product_id] = self._writes
+
+
+catalog_cache = CatalogCache()
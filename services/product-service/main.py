@@ -1,17 +1,30 @@
 import os
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from jose import jwt, JWTError
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from sqlalchemy import func, insert, text, update
 from sqlalchemy.orm import Session
-from database import get_db, Product as DBProduct
+from common.auth import require_admin
+from common.etag import body_etag, conditional_json
+from common.serialization import CompressionMiddleware, FastJSONResponse, dumps, trusted_response
+from catalog_cache import catalog_cache, STOCK_CACHE_TTL
+from common.db import DBRunner, dialect_insert
+from database import (
+    get_db, get_db_runner, pool_stats,
+    Product as DBProduct, StockReservation as DBStockReservation, StockReservationItem as DBStockReservationItem,
+)
+
+PRODUCT_PAGE_MAX = int(os.getenv("PRODUCT_PAGE_MAX", "500"))   # Max rows per GET /products page
+
+# Columns that can be requested with GET /products?fields=...
+PRODUCT_FIELDS = ("id", "name", "price", "inventory", "description")
 
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "devsecret")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+app = FastAPI(title="Product Service", default_response_class=FastJSONResponse)
 
-app = FastAPI(title="Product Service")
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
 )
 
 
@@ -48,33 +62,286 @@ class ProductUpdate(BaseModel):
 
 
 class StockUpdate(BaseModel):
+    quantity: int = Field(gt=0)  # Amount to take; a negative value would add stock
+
+
+class StockCheckItem(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+
+class StockCheckRequest(BaseModel):
+    items: List[StockCheckItem]
+
+
+class StockReserveRequest(BaseModel):
+    items: List[StockCheckItem]
+    # Caller's request id; a retry with the same id returns the first reservation instead of taking stock again
+    reservation_id: Optional[str] = Field(default=None, min_length=1, max_length=64)
+
+
+class StockReleaseRequest(BaseModel):
+    reservation_id: str = Field(min_length=1, max_length=64)
+
+
+class StockReservation(BaseModel):
+    product_id: int
     quantity: int
+    remaining: int
+
+
+class StockReserveResponse(BaseModel):
+    reserved: List[StockReservation]
+    reservation_id: Optional[str] = None
+
+
+class StockReleaseResponse(BaseModel):
+    released: List[StockReservation]
+    missing: List[int] = []
+
 
+class StockCheckResult(BaseModel):
+    product_id: int
+    requested: int
+    available: bool
+    current_stock: int
 
-def _require_admin(auth_header: str | None):
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing/invalid Authorization")
-    token = auth_header.split(" ", 1)[1]
+
+class StockCheckResponse(BaseModel):
+    available: bool
+    items: List[StockCheckResult]
+    missing: List[int] = []
+
+
+def _parse_ids(ids: str) -> List[int]:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin role required")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        return sorted({int(part) for part in ids.split(",") if part.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
 
 
-@app.get("/products", response_model=List[Product])
-def list_products(db: Session = Depends(get_db)):
-    products = db.query(DBProduct).all()
+def _parse_fields(fields: str) -> List[str]:
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # id is always returned, it is the pagination cursor
+    return ["id"] + [f for f in PRODUCT_FIELDS if f in requested and f != "id"]
+
+
+def _estimate_total(db: Session, query, filtered: bool) -> int:
+    """
+    Total row count for paginated listings.
+    Unfiltered listings on Postgres use the planner's row estimate (pg_class.reltuples)
+    so the cost stays constant as the catalog grows; filtered listings are counted.
+    """
+    if not filtered and db.get_bind().dialect.name == "postgresql":
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {"table": DBProduct.__tablename__},
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    return query.order_by(None).with_entities(func.count(DBProduct.id)).scalar()
+
+
+def _serialize_fields(row, fields: List[str]) -> dict:
+    item = {}
+    for field in fields:
+        value = getattr(row, field)
+        item[field] = float(value) if field == "price" and value is not None else value
+    return item
+
+
+def _product_dict(row) -> dict:
+    return Product.model_validate(row).model_dump()
+
+
+def _encoded_page(body: bytes, headers: dict | None = None) -> tuple[bytes, dict]:
+    # ETag is computed once per encoded body and cached with it
+    return body, {**(headers or {}), "ETag": body_etag(body)}
+
+
+def _json_bytes(page: tuple[bytes, dict], if_none_match: str | None) -> Response:
+    # Body is already encoded JSON: skips response_model validation and re-serialization
+    body, headers = page
+    return conditional_json(body, headers["ETag"], if_none_match, headers)
+
+
+def _fetch_products(db: Session, product_ids: List[int]) -> List[dict]:
+    """Load products from the database and add them to the row cache"""
+    read_token = catalog_cache.read_token()
+    products = [_product_dict(row) for row in db.query(DBProduct).filter(DBProduct.id.in_(product_ids)).all()]
+    for product in products:
+        catalog_cache.put_product(product, read_token)
     return products
 
 
+def _fetch_page(
+    db: Session,
+    columns: List[str] | None,
+    ids: str | None,
+    cursor: int | None,
+    limit: int | None,
+    min_price: float | None,
+    max_price: float | None,
+    in_stock: bool | None,
+) -> tuple[bytes, dict]:
+    read_token = catalog_cache.read_token()
+    query = db.query(*[getattr(DBProduct, f) for f in columns]) if columns else db.query(DBProduct)
+
+    if ids is not None:
+        # Batch lookup: one indexed WHERE id IN (...) instead of N single-row GETs
+        query = query.filter(DBProduct.id.in_(_parse_ids(ids)))
+    if min_price is not None:
+        query = query.filter(DBProduct.price >= min_price)
+    if max_price is not None:
+        query = query.filter(DBProduct.price <= max_price)
+    if in_stock is not None:
+        query = query.filter(DBProduct.inventory > 0 if in_stock else DBProduct.inventory <= 0)
+    filtered = any(v is not None for v in (ids, min_price, max_price, in_stock))
+
+    headers = {}
+    if limit is not None:
+        headers["X-Total-Count"] = str(_estimate_total(db, query, filtered))
+    if cursor is not None:
+        query = query.filter(DBProduct.id > cursor)
+    query = query.order_by(DBProduct.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    products = query.all()
+    if limit is not None and len(products) == limit:
+        headers["X-Next-Cursor"] = str(products[-1].id)
+
+    if columns:
+        body = dumps([_serialize_fields(p, columns) for p in products])
+    else:
+        items = [_product_dict(p) for p in products]
+        for item in items:
+            catalog_cache.put_product(item, read_token)
+        body = dumps(items)
+    return _encoded_page(body, headers)
+
+
+@app.get("/products", response_model=List[Product])
+async def list_products(
+    ids: str | None = Query(default=None, description="Comma-separated product ids, e.g. 1,2,3"),
+    cursor: int | None = Query(default=None, description="Return products with id greater than this (keyset pagination)"),
+    limit: int | None = Query(default=None, ge=1, le=PRODUCT_PAGE_MAX),
+    min_price: float | None = Query(default=None, ge=0),
+    max_price: float | None = Query(default=None, ge=0),
+    in_stock: bool | None = Query(default=None, description="true: inventory > 0, false: inventory = 0"),
+    fields: str | None = Query(default=None, description="Comma-separated columns to return, e.g. id,name,price"),
+    consistent: bool = Query(default=False, description="With ids: bypass the cache and read committed stock"),
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    columns = _parse_fields(fields) if fields else None
+    filters = (cursor, limit, min_price, max_price, in_stock)
+
+    if ids is not None and columns is None and all(v is None for v in filters):
+        # Batch lookup (cart / ordering): served from cached rows, misses loaded with one WHERE id IN (...).
+        # Rows carry inventory, so they are subject to the same STOCK_CACHE_TTL bound as stock reads
+        if consistent:
+            products, missing = [], _parse_ids(ids)
+        else:
+            products, missing = catalog_cache.get_products(_parse_ids(ids), max_age=STOCK_CACHE_TTL)
+        if missing:
+            products += await db.run(_fetch_products, missing)
+        products.sort(key=lambda p: p["id"])
+        return _json_bytes(_encoded_page(dumps(products)), if_none_match)
+
+    # Listings are cached as encoded pages, keyed by the normalized query
+    page_key = None if ids is not None else (tuple(columns or ()),) + filters
+    if page_key is not None:
+        cached = catalog_cache.get_page(page_key)
+        if cached is not None:
+            return _json_bytes(cached, if_none_match)
+
+    read_token = catalog_cache.read_token()
+    page = await db.run(_fetch_page, columns, ids, cursor, limit, min_price, max_price, in_stock)
+    if page_key is not None:
+        catalog_cache.put_page(page_key, *page, read_token)
+    return _json_bytes(page, if_none_match)
+
+
+def _sum_quantities(items: List[StockCheckItem]) -> dict[int, int]:
+    # Quantities for the same product are summed so duplicate lines can't each pass on their own
+    requested: dict[int, int] = {}
+    for item in items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    return requested
+
+
+def _decrement_stock(db: Session, product_id: int, quantity: int):
+    """
+    Conditionally decrement inventory in a single statement.
+    Returns the remaining inventory, or None when the product is missing or short on stock.
+    """
+    stmt = (
+        update(DBProduct)
+        .where(DBProduct.id == product_id, DBProduct.inventory >= quantity)
+        .values(inventory=DBProduct.inventory - quantity, updated_at=datetime.utcnow())
+        .returning(DBProduct.inventory)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def _raise_stock_error(db: Session, product_id: int):
+    current = db.query(DBProduct.inventory).filter(DBProduct.id == product_id).scalar()
+    if current is None:
+        raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+    raise HTTPException(
+        status_code=400,
+        detail=f"Product {product_id} insufficient stock. Available: {current}"
+    )
+
+
+@app.post("/products/stock/check", response_model=StockCheckResponse)
+def check_stock_bulk(payload: StockCheckRequest, db: Session = Depends(get_db)):
+    requested = _sum_quantities(payload.items)
+
+    rows = db.query(DBProduct.id, DBProduct.inventory).filter(DBProduct.id.in_(list(requested))).all()
+    inventory = {row.id: row.inventory for row in rows}
+
+    results = [
+        {
+            "product_id": product_id,
+            "requested": quantity,
+            "available": inventory[product_id] >= quantity,
+            "current_stock": inventory[product_id],
+        }
+        for product_id, quantity in requested.items()
+        if product_id in inventory
+    ]
+    missing = [product_id for product_id in requested if product_id not in inventory]
+    return {
+        "available": not missing and all(r["available"] for r in results),
+        "items": results,
+        "missing": missing,
+    }
+
+
 @app.get("/products/{product_id}", response_model=Product)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+async def get_product(
+    product_id: int,
+    if_none_match: str | None = Header(default=None),
+    db: DBRunner = Depends(get_db_runner),
+):
+    # Encoded body + ETag are kept with the list pages, so they are dropped on the same writes
+    page = catalog_cache.get_page(("product", product_id))
+    if page is None:
+        read_token = catalog_cache.read_token()
+        product = catalog_cache.get_product(product_id)
+        if product is None:
+            product = next(iter(await db.run(_fetch_products, [product_id])), None)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        page = _encoded_page(dumps(product))
+        catalog_cache.put_page(("product", product_id), *page, read_token)
+    return _json_bytes(page, if_none_match)
 
 
 @app.post("/products", response_model=Product, status_code=201)
@@ -83,12 +350,13 @@ def create_product(
     db: Session = Depends(get_db),
     authorization: str | None = Header(default=None)
 ):
-    _require_admin(authorization)
+    require_admin(authorization)
     product = DBProduct(**payload.dict())
     db.add(product)
     db.commit()
     db.refresh(product)
-    return product
+    catalog_cache.invalidate_lists()
+    return trusted_response(product, Product, status_code=201)
 
 
 @app.put("/products/{product_id}", response_model=Product)
@@ -98,7 +366,7 @@ def update_product(
     db: Session = Depends(get_db),
     authorization: str | None = Header(default=None)
 ):
-    _require_admin(authorization)
+    require_admin(authorization)
     product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -109,7 +377,8 @@ def update_product(
     
     db.commit()
     db.refresh(product)
-    return product
+    catalog_cache.invalidate_product(product_id)
+    return trusted_response(product, Product)
 
 
 @app.delete("/products/{product_id}", status_code=204)
@@ -118,7 +387,7 @@ def delete_product(
     db: Session = Depends(get_db),
     authorization: str | None = Header(default=None)
 ):
-    _require_admin(authorization)
+    require_admin(authorization)
     product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -137,33 +406,171 @@ def delete_product(
         # Re-raise other exceptions
         raise HTTPException(status_code=500, detail=f"Failed to delete product: {str(e)}")
     
+    catalog_cache.invalidate_product(product_id)
     return None
 
 
 @app.get("/products/{product_id}/stock")
-def check_stock(product_id: int, quantity: int, db: Session = Depends(get_db)):
-    product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return {"available": product.inventory >= quantity, "current_stock": product.inventory}
+async def check_stock(
+    product_id: int,
+    quantity: int,
+    consistent: bool = Query(default=False, description="Read-your-writes: bypass the cache and read committed stock"),
+    db: DBRunner = Depends(get_db_runner),
+):
+    # Cached stock is at most STOCK_CACHE_TTL seconds old (writes through this instance update it immediately)
+    product = None if consistent else catalog_cache.get_product(product_id, max_age=STOCK_CACHE_TTL)
+    if product is None:
+        product = next(iter(await db.run(_fetch_products, [product_id])), None)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+    return {"available": product["inventory"] >= quantity, "current_stock": product["inventory"]}
 
 
 @app.put("/products/{product_id}/stock", response_model=Product)
-def update_stock(product_id: int, update: StockUpdate, db: Session = Depends(get_db)):
-    product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    new_inventory = product.inventory - update.quantity
-    if new_inventory < 0:
+def update_stock(product_id: int, payload: StockUpdate, db: Session = Depends(get_db)):
+    # Conditional UPDATE instead of read-modify-write, so concurrent buyers can't oversell
+    if _decrement_stock(db, product_id, payload.quantity) is None:
+        db.rollback()
+        product = db.query(DBProduct).filter(DBProduct.id == product_id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=400, detail="Insufficient inventory")
-    
-    product.inventory = new_inventory
+
     db.commit()
-    db.refresh(product)
+    product = _product_dict(db.query(DBProduct).filter(DBProduct.id == product_id).first())
+    catalog_cache.write_product(product)
+    catalog_cache.invalidate_lists()
     return product
 
 
+def _claim_reservation(db: Session, reservation_id: str, status: str) -> bool:
+    """
+    Insert the reservation row with `status`; False when the id is already taken.
+    A concurrent insert of the same id waits for the other transaction to finish.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        dialect_insert(db)(DBStockReservation)
+        .values(reservation_id=reservation_id, status=status, created_at=now, updated_at=now)
+        .on_conflict_do_nothing(index_elements=[DBStockReservation.reservation_id])
+        .returning(DBStockReservation.reservation_id)
+    )
+    return db.execute(stmt).scalar_one_or_none() is not None
+
+
+def _replay_reservation(db: Session, reservation_id: str) -> dict:
+    status = db.query(DBStockReservation.status).filter(DBStockReservation.reservation_id == reservation_id).scalar()
+    if status != "reserved":
+        raise HTTPException(status_code=409, detail=f"Reservation {reservation_id} was already released")
+    rows = (
+        db.query(DBStockReservationItem.product_id, DBStockReservationItem.quantity, DBProduct.inventory)
+        .outerjoin(DBProduct, DBProduct.id == DBStockReservationItem.product_id)
+        .filter(DBStockReservationItem.reservation_id == reservation_id)
+        .order_by(DBStockReservationItem.product_id)
+        .all()
+    )
+    reserved = [{"product_id": pid, "quantity": quantity, "remaining": inventory or 0} for pid, quantity, inventory in rows]
+    return {"reserved": reserved, "reservation_id": reservation_id}
+
+
+@app.post("/products/stock/reserve", response_model=StockReserveResponse)
+def reserve_stock(payload: StockReserveRequest, db: Session = Depends(get_db)):
+    """
+    Decrement stock for every item in one transaction (all-or-nothing).
+    Rows are updated in ascending product id order, so concurrent reservations
+    always take row locks in the same order and cannot deadlock.
+
+    With a reservation_id the reservation is recorded under it: retrying the same id
+    returns the first result without taking stock twice, and an id that was already
+    released is refused with 409.
+    """
+    requested = _sum_quantities(payload.items)
+    reservation_id = payload.reservation_id
+    reserved = []
+    try:
+        if reservation_id is not None and not _claim_reservation(db, reservation_id, "reserved"):
+            result = _replay_reservation(db, reservation_id)
+            db.rollback()
+            return result
+        for product_id in sorted(requested):
+            remaining = _decrement_stock(db, product_id, requested[product_id])
+            if remaining is None:
+                _raise_stock_error(db, product_id)
+            reserved.append({"product_id": product_id, "quantity": requested[product_id], "remaining": remaining})
+        if reservation_id is not None and reserved:
+            db.execute(insert(DBStockReservationItem), [
+                {"reservation_id": reservation_id, "product_id": item["product_id"], "quantity": item["quantity"]}
+                for item in reserved
+            ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for item in reserved:
+        catalog_cache.set_inventory(item["product_id"], item["remaining"])
+    catalog_cache.invalidate_lists()
+    return {"reserved": reserved, "reservation_id": reservation_id}
+
+
+@app.post("/products/stock/release", response_model=StockReleaseResponse)
+def release_stock(payload: StockReleaseRequest, db: Session = Depends(get_db)):
+    """
+    Give back the stock recorded under a reservation id (compensation when an order
+    fails after its reservation). Only what was reserved is returned, and only once:
+    repeating the call releases nothing. Releasing an id that was never reserved
+    records it as released, so a reserve with that id arriving late is refused.
+    Same ascending lock order as reserve; deleted products are skipped.
+    """
+    reservation_id = payload.reservation_id
+    released, missing = [], []
+    try:
+        if _claim_reservation(db, reservation_id, "released"):
+            db.commit()
+            return {"released": released, "missing": missing}
+        stmt = (
+            update(DBStockReservation)
+            .where(DBStockReservation.reservation_id == reservation_id, DBStockReservation.status == "reserved")
+            .values(status="released", updated_at=datetime.utcnow())
+            .returning(DBStockReservation.reservation_id)
+            .execution_options(synchronize_session=False)
+        )
+        if db.execute(stmt).scalar_one_or_none() is None:
+            db.rollback()
+            return {"released": released, "missing": missing}
+        items = (
+            db.query(DBStockReservationItem.product_id, DBStockReservationItem.quantity)
+            .filter(DBStockReservationItem.reservation_id == reservation_id)
+            .order_by(DBStockReservationItem.product_id)
+            .all()
+        )
+        for product_id, quantity in items:
+            stmt = (
+                update(DBProduct)
+                .where(DBProduct.id == product_id)
+                .values(inventory=DBProduct.inventory + quantity, updated_at=datetime.utcnow())
+                .returning(DBProduct.inventory)
+                .execution_options(synchronize_session=False)
+            )
+            remaining = db.execute(stmt).scalar_one_or_none()
+            if remaining is None:
+                missing.append(product_id)
+            else:
+                released.append({"product_id": product_id, "quantity": quantity, "remaining": remaining})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for item in released:
+        catalog_cache.set_inventory(item["product_id"], item["remaining"])
+    catalog_cache.invalidate_lists()
+    return {"released": released, "missing": missing}
+
+
+@app.get("/metrics")
+def metrics():
+    return {"catalog_cache": catalog_cache.stats(), "db_pool": pool_stats()}
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}